@@ -0,0 +1,229 @@
+import asyncio
+import socket
+import time
+from Config import Colors, Config
+from ClientNew import Client, TcpSession, UdpTransfer
+from Log import log
+
+
+class TcpCountingProtocol(asyncio.BufferedProtocol):
+    """
+    Counts a TCP payload as the event loop reads it with recv_into. Every
+    connection hands out the same buffer, since the bytes are never looked at,
+    unless it fills a segment of a segmented download in place.
+    """
+
+    def __init__(self, buffer, segment=None):
+        self.buffer = buffer
+        self.segment = segment
+        self.bytes_received = 0
+        self.recv_calls = 0
+        self.closed = False
+        self.progress = asyncio.Event()
+
+    def get_buffer(self, sizehint):
+        if self.segment is None or self.bytes_received >= len(self.segment):
+            return self.buffer
+        return self.segment[self.bytes_received:]
+
+    def buffer_updated(self, nbytes):
+        self.bytes_received += nbytes
+        self.recv_calls += 1
+        self.progress.set()
+
+    def eof_received(self):
+        self.closed = True
+        self.progress.set()
+        return False
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.progress.set()
+
+
+class UdpTransferProtocol(asyncio.DatagramProtocol):
+    """Feeds datagrams into a UdpTransfer and sends back whatever it asks for."""
+
+    def __init__(self, transfer):
+        self.transfer = transfer
+        self.transport = None
+        self.arrived = asyncio.Event()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        message = self.transfer.on_datagram(data, len(data))
+        if message:
+            self.transport.sendto(message)
+        self.arrived.set()
+
+
+class AsyncClient(Client):
+    """
+    Client engine that runs all of a round's TCP and UDP transfers on one
+    asyncio event loop instead of a thread each. Reports and statistics are
+    the thread engine's; memory per connection is a protocol object, not a
+    thread stack and a receive buffer.
+    """
+
+    def start_connections(self):
+        self.transfer_threads = []
+        self.start_round()
+        asyncio.run(self.run_transfers())
+        self.finish_round()
+
+    async def run_transfers(self):
+        server_ip, udp_port, tcp_port = self.current_server
+        # payload is only counted, so every tcp connection reads into the same buffer
+        tcp_buffer = bytearray(Config.CLIENT_TCP_RECV_SIZE)
+        await asyncio.gather(
+            *((self.tcp_session if self.keep_alive_mode() else self.tcp_transfer)(
+                server_ip, tcp_port, i + 1, tcp_buffer, offset, length)
+              for i, (offset, length) in enumerate(self.tcp_ranges())),
+            *(self.udp_transfer(server_ip, udp_port, i + 1) for i in range(self.udp_connections)),
+        )
+
+    async def tcp_transfer(self, server_ip, tcp_port, connection_id, buffer, offset, length):
+        loop = asyncio.get_running_loop()
+        start_time = time.time()
+        bytes_received = 0
+        recv_calls = 0
+        wasted = 0
+        completed = False
+        for retry in range(Config.MAX_RETRIES):
+            if retry:
+                await asyncio.sleep(self.retry_delay(retry - 1))
+                kept = self.bytes_to_keep(connection_id, bytes_received)
+                wasted += bytes_received - kept
+                bytes_received = kept
+            transport = None
+            tcp_socket = None
+            protocol = None
+            try:
+                tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                if Config.CLIENT_TCP_RCVBUF:
+                    # must be set before connect for the window scale to take it into account
+                    tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, Config.CLIENT_TCP_RCVBUF)
+                tcp_socket.setblocking(False)
+                timeout = 1.0 + retry * 0.5
+
+                if not retry:
+                    log.info("{BLUE}Starting TCP transfer #{connection_id}...{ENDC}", connection_id=connection_id)
+                await asyncio.wait_for(loop.sock_connect(tcp_socket, (server_ip, tcp_port)), timeout)
+                self.tcp_transfers+=1
+                remaining = length - bytes_received
+                segment = self.segment_view(offset + bytes_received, remaining)
+                transport, protocol = await loop.create_connection(lambda: TcpCountingProtocol(buffer, segment),
+                                                                   sock=tcp_socket)
+                transport.write(self.tcp_request(offset + bytes_received, remaining))
+
+                while protocol.bytes_received < remaining and self.is_running:
+                    if protocol.closed:
+                        raise ConnectionError("Server closed connection prematurely")
+                    protocol.progress.clear()
+                    try:
+                        await asyncio.wait_for(protocol.progress.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        raise socket.timeout("timed out") from None
+                completed = True
+                break
+
+            except Exception as e:
+                log.error("{RED}✗ TCP transfer #{connection_id} error: {error}{ENDC}", connection_id=connection_id, error=e)
+                self.failed_transfers+=1
+            finally:
+                if protocol:
+                    bytes_received += protocol.bytes_received
+                    recv_calls += protocol.recv_calls
+                if transport:
+                    transport.close()
+                elif tcp_socket:
+                    tcp_socket.close()
+
+        self.finish_tcp_transfer(connection_id, completed, bytes_received, time.time() - start_time, recv_calls,
+                                 offset, retry, wasted)
+
+    async def tcp_session(self, server_ip, tcp_port, connection_id, buffer, offset, length):
+        loop = asyncio.get_running_loop()
+        transport = None
+        tcp_socket = None
+        try:
+            session = TcpSession(length)
+            tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if Config.CLIENT_TCP_RCVBUF:
+                tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, Config.CLIENT_TCP_RCVBUF)
+            tcp_socket.setblocking(False)
+
+            log.info("{BLUE}Starting TCP session #{connection_id}...{ENDC}", connection_id=connection_id)
+            await asyncio.wait_for(loop.sock_connect(tcp_socket, (server_ip, tcp_port)), Config.TIMEOUT)
+            self.tcp_transfers+=1
+            transport, protocol = await loop.create_connection(lambda: TcpCountingProtocol(buffer), sock=tcp_socket)
+            request = self.tcp_request(offset, length, keep_alive=True)
+
+            while not session.done() and self.is_running:
+                pending = session.requests_to_send()
+                if pending:
+                    transport.write(request * pending)
+                if protocol.closed:
+                    raise ConnectionError("Server closed connection prematurely")
+                protocol.progress.clear()
+                try:
+                    await asyncio.wait_for(protocol.progress.wait(), Config.TIMEOUT)
+                except asyncio.TimeoutError:
+                    raise socket.timeout("timed out") from None
+                session.on_data(protocol.bytes_received - session.bytes_received,
+                                protocol.recv_calls - session.recv_calls)
+
+            self.report_tcp_session(connection_id, session)
+
+        except Exception as e:
+            log.error("{RED}✗ TCP session #{connection_id} error: {error}{ENDC}", connection_id=connection_id, error=e)
+            self.failed_transfers+=1
+            self.record_result('tcp', connection_id, False)
+        finally:
+            if transport:
+                transport.close()
+            elif tcp_socket:
+                tcp_socket.close()
+
+    async def udp_transfer(self, server_ip, udp_port, connection_id):
+        loop = asyncio.get_running_loop()
+        transport = None
+        try:
+            transfer = UdpTransfer(time.time())
+            log.info("{BLUE}Starting UDP transfer #{connection_id}...{ENDC}", connection_id=connection_id)
+            self.udp_transfers+=1
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda: UdpTransferProtocol(transfer), remote_addr=(server_ip, udp_port)
+            )
+            # the loop reads one datagram per callback
+            self.set_udp_receive_buffer(transport.get_extra_info('socket'))
+            transport.sendto(transfer.request(self.file_size))
+
+            while self.is_running:
+                protocol.arrived.clear()
+                try:
+                    await asyncio.wait_for(protocol.arrived.wait(), transfer.quiet_timeout)
+                except asyncio.TimeoutError:
+                    message, finished = transfer.on_quiet()
+                    if message:
+                        transport.sendto(message)
+                    if finished:
+                        break
+
+            self.report_udp_transfer(connection_id, transfer, time.time())
+
+        except Exception as e:
+            log.error("{RED}✗ UDP transfer #{connection_id} error: {error}{ENDC}\n", connection_id=connection_id, error=e)
+            self.failed_transfers+=1
+            self.record_result('udp', connection_id, False, loss=1.0)
+        finally:
+            if transport:
+                transport.close()
+
+
+if __name__ == "__main__":
+    client = AsyncClient()
+    print(f"{Colors.HEADER}{Colors.BOLD}Client Started{Colors.ENDC}")
+    client.run()
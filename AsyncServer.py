@@ -0,0 +1,321 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from Config import Colors, Config
+from Log import log
+from ServerNew import Server
+from UdpScheduler import UdpSession
+from Protocol import PAYLOAD_HEADER, message_type, pack_payload_header_into, parse_nack, parse_request
+from TcpRequest import TcpRequest, TCP_REQUEST
+
+
+class UdpRequestProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        # cleared while the transport buffer is above its high-water mark
+        self.can_write = asyncio.Event()
+        self.can_write.set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        if message_type(data) == Config.NACK_TYPE:
+            self.server.handle_udp_feedback(data, address)
+        else:
+            self.server.start_udp_session(self, data, address)
+
+    def error_received(self, exc):
+        log.error("{RED}✗ UDP handler error: {error}{ENDC}", error=exc)
+        self.server.transfer_errors.add()
+
+    def pause_writing(self):
+        self.can_write.clear()
+
+    def resume_writing(self):
+        self.can_write.set()
+
+
+class AsyncServer(Server):
+    """
+    Same protocol and statistics as Server, but every TCP and UDP transfer
+    runs as a task on one asyncio event loop instead of a pool thread.
+    """
+
+    def __init__(self, tcp_port=0, udp_port=0, reuse_port=False):
+        super().__init__(tcp_port, udp_port, reuse_port)
+        self.udp_tasks = set()
+        self.udp_sessions = {}
+        # (future, size) of sessions waiting for udp memory, in arrival order
+        self.udp_memory_waiters = deque()
+        # one datagram slot for every session: sendto() either sends it at once or copies it into
+        # the transport buffer, so only the header is packed per segment
+        self.udp_slot = bytearray(b'A' * (PAYLOAD_HEADER.size + Config.CHUNK_SIZE))
+        self.udp_slot_view = memoryview(self.udp_slot)
+
+    #running server: broadcast and statistics stay on daemon threads, transfers on the loop
+    def run(self):
+        metrics_endpoint = None
+        try:
+            metrics_endpoint = self.start_metrics_endpoint()
+            self.start_discovery()
+            threading.Thread(target=self.periodic_statistics, daemon=True).start()
+
+            print(f"{Colors.GREEN}Server is running (asyncio engine) and listening on IP address {self.SERVER_IP}{Colors.ENDC}")
+            asyncio.run(self.serve())
+
+        except KeyboardInterrupt:
+            print(f"{Colors.YELLOW}Server shutting down manually...{Colors.ENDC}")
+        finally:
+            self.is_running = False
+            if metrics_endpoint:
+                metrics_endpoint.stop()
+            self.tcp_socket.close()
+            self.udp_socket.close()
+            log.flush()
+            print(f"{Colors.GREEN}Server shutdown complete{Colors.ENDC}")
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.tcp_socket.setblocking(False)
+        self.udp_socket.setblocking(False)
+        # the thread engine listens with MAX_CLIENTS, which is far too small here
+        self.tcp_socket.listen(Config.ASYNC_BACKLOG)
+
+        tcp_server = await asyncio.start_server(self.handle_tcp_stream, sock=self.tcp_socket)
+        udp_transport, _ = await loop.create_datagram_endpoint(
+            lambda: UdpRequestProtocol(self), sock=self.udp_socket
+        )
+        try:
+            while self.is_running:
+                await asyncio.sleep(1)
+        finally:
+            udp_transport.close()
+            tcp_server.close()
+            await tcp_server.wait_closed()
+
+    #tcp client handling
+    #the stream counterpart of Server.read_tcp_request
+    @staticmethod
+    async def read_tcp_request_async(reader):
+        try:
+            first_byte = await reader.readexactly(1)
+        except asyncio.IncompleteReadError:
+            return None
+        if TcpRequest.is_frame(first_byte[0]):
+            try:
+                return TcpRequest.from_frame(first_byte + await reader.readexactly(TCP_REQUEST.size - 1))
+            except asyncio.IncompleteReadError as e:
+                raise ValueError(f"truncated request frame ({len(e.partial) + 1} of {TCP_REQUEST.size} bytes)")
+        line = (first_byte + await reader.readline()).decode().strip()
+        return TcpRequest.from_ascii(line) if line else None
+
+    async def handle_tcp_stream(self, reader, writer):
+        address = writer.get_extra_info('peername')
+        self.track_client(address[0], 'tcp')
+        self.tcp_connections.add()
+
+        try:
+            keep_alive = True
+            first_request = True
+            while keep_alive and self.is_running:
+                try:
+                    request = await asyncio.wait_for(self.read_tcp_request_async(reader),
+                                                     30 if first_request else Config.TCP_KEEPALIVE_TIMEOUT)
+                    request_ns = time.monotonic_ns()
+                except asyncio.TimeoutError:
+                    if first_request:
+                        raise
+                    break  # idle keep-alive connection
+                if request is None:
+                    return
+
+                keep_alive = request.keep_alive
+                self.tcp_requests.add()
+                if first_request:
+                    log.info("{GREEN}➜ New TCP client connected from {CYAN}{address}{ENDC}", address=address)
+                    first_request = False
+                log.info(self.format_tcp_request, address=address, request=request)
+                bytes_sent = 0
+                rate = self.tcp_rate(request)
+                chunk_size = self.tcp_chunk_size(request, rate)
+                start_time = time.monotonic()
+
+                self.active_tcp_requests.add()
+                try:
+                    while bytes_sent < request.length and self.is_running:
+                        to_send = min(chunk_size, request.length - bytes_sent)
+                        delay = self.tcp_pacing_delay(start_time, bytes_sent + to_send, rate)
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        send_started = time.monotonic_ns()
+                        writer.write(self.tcp_payload_chunk(request, bytes_sent, to_send))
+                        # only pay for a timeout when the client is actually applying backpressure
+                        if writer.transport.get_write_buffer_size() > Config.ASYNC_WRITE_HIGH_WATER:
+                            await asyncio.wait_for(writer.drain(), 30)
+                        send_finished = time.monotonic_ns()
+                        if not bytes_sent:
+                            self.tcp_metrics.first_byte.record(send_finished - request_ns)
+                        self.tcp_metrics.record_send(to_send, send_started, send_finished)
+                        bytes_sent += to_send
+                        self.total_tcp_data_sent.add(to_send)
+                    await asyncio.wait_for(writer.drain(), 30)
+                finally:
+                    self.active_tcp_requests.sub()
+                if bytes_sent == request.length:
+                    self.tcp_metrics.duration.record(time.monotonic_ns() - request_ns)
+                self.report_tcp_request(address, bytes_sent, time.monotonic() - start_time)
+
+        except Exception as e:
+            log.error("{RED}✗ Error handling TCP client {address}: {error}{ENDC}", address=address, error=e)
+            self.transfer_errors.add()
+        finally:
+            writer.close()
+            self.untrack_client(address[0], 'tcp')
+
+    #validating a udp request and scheduling its transfer on the loop
+    def start_udp_session(self, protocol, data, address):
+        file_size = parse_request(data)
+        if file_size is None:
+            return
+
+        self.track_client(address[0], 'udp')
+        self.udp_connections.add()
+        session = UdpSession(address, file_size)
+        session.feedback = asyncio.Event()
+        # a new request from the same socket ends the session lingering there
+        previous = self.udp_sessions.get(address)
+        if previous:
+            previous.acknowledged = True
+            previous.feedback.set()
+        self.udp_sessions[address] = session
+
+        task = asyncio.get_running_loop().create_task(self.send_udp_segments(protocol, session))
+        self.udp_tasks.add(task)
+        task.add_done_callback(self.udp_tasks.discard)
+
+    def handle_udp_feedback(self, data, address):
+        feedback = parse_nack(data)
+        session = self.udp_sessions.get(address)
+        if feedback and session:
+            session.apply_feedback(*feedback)
+            session.feedback.set()
+
+    #connections are tasks on the loop, there are no worker threads
+    def create_thread_pool(self):
+        return None
+
+    #sessions are tasks on the loop, there is no scheduler thread
+    def create_udp_scheduler(self):
+        return None
+
+    def live_udp_sessions(self):
+        return len(self.udp_tasks) - len(self.udp_memory_waiters)
+
+    def waiting_udp_sessions(self):
+        return len(self.udp_memory_waiters)
+
+    #waits its turn behind earlier sessions; release_udp_memory wakes them in arrival order
+    async def reserve_udp_memory(self, session):
+        if not self.udp_memory_waiters and self.udp_memory.try_reserve(session.memory):
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, session.memory)
+        self.udp_memory_waiters.append(entry)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the memory was granted just before the cancel
+                self.release_udp_memory(session.memory)
+            else:
+                if entry in self.udp_memory_waiters:
+                    self.udp_memory_waiters.remove(entry)
+                # the sessions behind this one may fit now
+                self.admit_udp_waiters()
+            raise
+
+    def release_udp_memory(self, size):
+        self.udp_memory.release(size)
+        self.admit_udp_waiters()
+
+    def admit_udp_waiters(self):
+        while self.udp_memory_waiters:
+            waiter, size = self.udp_memory_waiters[0]
+            if waiter.done():
+                # cancelled, its task is still unwinding
+                self.udp_memory_waiters.popleft()
+                continue
+            if not self.udp_memory.try_reserve(size):
+                return
+            self.udp_memory_waiters.popleft()
+            waiter.set_result(None)
+
+    async def send_pending_segments(self, protocol, session):
+        await self.reserve_udp_memory(session)
+        try:
+            while session.has_pending() and self.is_running:
+                wait = max(session.pacer.wait_time(), self.udp_pacer.wait_time())
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+
+                bytes_sent = 0
+                send_started = time.monotonic_ns()
+                for segment_number in session.next_burst():
+                    pack_payload_header_into(self.udp_slot, 0, session.total_segments, segment_number + 1)
+                    length = PAYLOAD_HEADER.size + session.payload_size(segment_number)
+                    protocol.transport.sendto(self.udp_slot_view[:length], session.address)
+                    bytes_sent += length
+                # a full transport buffer is the loop's form of a blocking send
+                await protocol.can_write.wait()
+                session.record_send(self.udp_metrics, bytes_sent, send_started, time.monotonic_ns())
+                session.last_sent = time.time()
+                session.pacer.consume(bytes_sent)
+                self.udp_pacer.consume(bytes_sent)
+
+                # give other sessions and the tcp streams a turn
+                await asyncio.sleep(0)
+        finally:
+            self.release_udp_memory(session.memory)
+
+    #lingers for NACKs, True when there are segments to resend
+    async def wait_for_feedback(self, session):
+        while not session.acknowledged and self.is_running:
+            try:
+                await asyncio.wait_for(session.feedback.wait(), Config.UDP_NACK_LINGER)
+            except asyncio.TimeoutError:
+                return False
+            session.feedback.clear()
+            if session.has_pending():
+                return True
+        return False
+
+    async def send_udp_segments(self, protocol, session):
+        address = session.address
+        try:
+            self.report_udp_request(address, session.file_size)
+
+            await self.send_pending_segments(protocol, session)
+            while await self.wait_for_feedback(session):
+                await self.send_pending_segments(protocol, session)
+
+            self.total_udp_data_sent.add(session.bytes_sent)
+            if session.last_sent_ns is not None:
+                self.udp_metrics.duration.record(session.last_sent_ns - session.created_ns)
+            self.report_udp_session(session)
+
+        except Exception as e:
+            log.error("{RED}✗ UDP transfer error to {address}: {error}{ENDC}", address=address, error=e)
+        finally:
+            if self.udp_sessions.get(address) is session:
+                del self.udp_sessions[address]
+            self.untrack_client(address[0], 'udp')
+
+
+if __name__ == '__main__':
+    server = AsyncServer()
+    print(f"{Colors.HEADER}{Colors.BOLD}Server Started{Colors.ENDC}")
+    server.run()
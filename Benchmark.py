@@ -0,0 +1,284 @@
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import threading
+import time
+from Config import Colors, Config, Format
+from BenchmarkUtils import parse_list, parse_size, percentile
+from ClientNew import create_client
+from MemoryBudget import peak_rss, reset_peak_rss
+from ServerNew import Server
+from AsyncServer import AsyncServer
+from Protocol import PAYLOAD_HEADER
+from Log import log, QUIET
+
+# throughput and p99 may move by --tolerance (relative), loss by --loss-tolerance (absolute); failures may not grow
+COMPARED_METRICS = {'throughput': 1, 'p99': -1}
+
+
+class NoOfferMixin:
+    """Benchmark servers are addressed directly, so they take no part in discovery."""
+
+    def start_discovery(self):
+        return
+
+
+class BenchmarkThreadServer(NoOfferMixin, Server):
+    pass
+
+
+class BenchmarkAsyncServer(NoOfferMixin, AsyncServer):
+    pass
+
+
+ENGINES = {'thread': BenchmarkThreadServer, 'asyncio': BenchmarkAsyncServer}
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+#server process: reports its ports, then answers 'usage' until told to 'stop'
+def run_server(engine, chunk_size, send_size, control):
+    Config.CHUNK_SIZE = chunk_size
+    Config.TCP_SEND_SIZE = send_size
+    # transfer events would only be formatted for devnull
+    log.set_level(QUIET)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        server = ENGINES[engine]()
+        control.send((server.SERVER_UDP_PORT, server.SERVER_TCP_PORT))
+
+        def answer_control():
+            while True:
+                command = control.recv()
+                if command == 'usage':
+                    control.send((cpu_time(), peak_rss()))
+                elif command == 'reset':
+                    control.send(reset_peak_rss())
+                elif command == 'stop':
+                    server.stop()
+                    return
+
+        threading.Thread(target=answer_control, daemon=True).start()
+        server.run()
+
+
+class Benchmark:
+    """
+    Runs a matrix of loopback transfers against a server in a child process
+    and records throughput, transfer time percentiles, UDP loss, CPU time and
+    peak RSS for every case. The server process is started once per engine,
+    UDP chunk size and TCP send size, since both are fixed when it starts.
+    """
+
+    def __init__(self, engines, chunk_sizes, send_sizes, file_sizes, tcp_counts, udp_counts, repeat):
+        self.engines = engines
+        self.chunk_sizes = chunk_sizes
+        self.send_sizes = send_sizes
+        self.file_sizes = file_sizes
+        self.tcp_counts = tcp_counts
+        self.udp_counts = udp_counts
+        self.repeat = repeat
+        self.context = multiprocessing.get_context('spawn')
+
+    @staticmethod
+    def case_key(engine, chunk_size, send_size, file_size, tcp_count, udp_count):
+        return f"{engine}/chunk={chunk_size}/send={send_size}/size={file_size}/tcp={tcp_count}/udp={udp_count}"
+
+    #chunk size only shapes udp datagrams and send size only tcp writes, so a case that does
+    #not use one of them is run for its first value only instead of being repeated
+    def is_duplicate(self, chunk_size, send_size, tcp_count, udp_count):
+        return ((not udp_count and chunk_size != self.chunk_sizes[0])
+                or (not tcp_count and send_size != self.send_sizes[0]))
+
+    def start_server(self, engine, chunk_size, send_size):
+        control, child_control = self.context.Pipe()
+        process = self.context.Process(target=run_server, args=(engine, chunk_size, send_size, child_control),
+                                       daemon=True)
+        process.start()
+        if not control.poll(30):
+            process.terminate()
+            raise RuntimeError(f"{engine} server did not start")
+        udp_port, tcp_port = control.recv()
+        return process, control, ('127.0.0.1', udp_port, tcp_port)
+
+    @staticmethod
+    def stop_server(process, control):
+        control.send('stop')
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+    @staticmethod
+    def server_usage(control):
+        control.send('usage')
+        return control.recv()
+
+    #True when both processes restarted their peak rss, so the case's figures are its own
+    @staticmethod
+    def reset_peak_rss(control):
+        control.send('reset')
+        return control.recv() and reset_peak_rss()
+
+    def run_case(self, server, control, file_size, tcp_count, udp_count):
+        results = []
+        wall_time = 0.0
+        # udp clients wait out a quiet timeout before returning, so throughput is
+        # measured up to the last finished transfer of every round instead
+        transfer_time = 0.0
+        rss_per_case = self.reset_peak_rss(control)
+        client_cpu = cpu_time()
+        server_cpu, _ = self.server_usage(control)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for _ in range(self.repeat):
+                client = create_client(file_size, tcp_count, udp_count)
+                start_time = time.perf_counter()
+                round_results = client.transfer(server)
+                round_time = time.perf_counter() - start_time
+                wall_time += round_time
+                transfer_time += max((result['duration'] for result in round_results if result['success']),
+                                     default=round_time)
+                results += round_results
+        client_cpu = cpu_time() - client_cpu
+        server_cpu_after, server_peak_rss = self.server_usage(control)
+
+        succeeded = [result for result in results if result['success']]
+        durations = [result['duration'] for result in succeeded]
+        udp_losses = [result['loss'] for result in results if result['protocol'] == 'udp']
+        total_bytes = sum(result['bytes'] for result in results)
+        return {
+            'transfers': len(results),
+            'failed': len(results) - len(succeeded),
+            'bytes': total_bytes,
+            'wall_time': wall_time,
+            'throughput': total_bytes * 8 / transfer_time if transfer_time > 0 else 0.0,
+            'p50': percentile(durations, 0.5),
+            'p99': percentile(durations, 0.99),
+            'udp_loss': sum(udp_losses) / len(udp_losses) if udp_losses else 0.0,
+            'client_cpu': client_cpu,
+            'server_cpu': server_cpu_after - server_cpu,
+            'client_peak_rss': peak_rss(),
+            'server_peak_rss': server_peak_rss,
+            # False: the peaks are the processes' lifetime highs, carried over from earlier cases
+            'peak_rss_per_case': rss_per_case,
+        }
+
+    def run(self):
+        cases = {}
+        for engine, chunk_size, send_size in itertools.product(self.engines, self.chunk_sizes, self.send_sizes):
+            process, control, server = self.start_server(engine, chunk_size, send_size)
+            try:
+                for file_size, tcp_count, udp_count in itertools.product(self.file_sizes, self.tcp_counts, self.udp_counts):
+                    if not tcp_count and not udp_count:
+                        continue
+                    if self.is_duplicate(chunk_size, send_size, tcp_count, udp_count):
+                        continue
+                    key = self.case_key(engine, chunk_size, send_size, file_size, tcp_count, udp_count)
+                    case = self.run_case(server, control, file_size, tcp_count, udp_count)
+                    cases[key] = case
+                    self.print_case(key, case)
+            finally:
+                self.stop_server(process, control)
+        return cases
+
+    @staticmethod
+    def print_case(key, case):
+        color = Colors.RED if case['failed'] else Colors.GREEN
+        print(f"{color}{key}{Colors.ENDC}\n"
+              f"  {Colors.BLUE}├─ Throughput: {Colors.CYAN}{Format.format_speed(case['throughput'])}{Colors.ENDC}\n"
+              f"  {Colors.BLUE}├─ Transfer time p50/p99: {Colors.CYAN}{case['p50']:.3f}s / {case['p99']:.3f}s{Colors.ENDC}\n"
+              f"  {Colors.BLUE}├─ UDP loss: {Colors.CYAN}{case['udp_loss'] * 100:.2f}%{Colors.ENDC}\n"
+              f"  {Colors.BLUE}├─ CPU client/server: {Colors.CYAN}{case['client_cpu']:.2f}s / {case['server_cpu']:.2f}s{Colors.ENDC}\n"
+              f"  {Colors.BLUE}├─ Peak RSS client/server: {Colors.CYAN}{Format.format_size(case['client_peak_rss'] or 0)}"
+              f" / {Format.format_size(case['server_peak_rss'] or 0)}"
+              f"{'' if case['peak_rss_per_case'] else ' (cumulative)'}{Colors.ENDC}\n"
+              f"  {Colors.BLUE}└─ Failed transfers: {Colors.CYAN}{case['failed']}/{case['transfers']}{Colors.ENDC}")
+
+
+#returns one line per metric that regressed beyond the tolerances
+def compare(cases, baseline, tolerance, loss_tolerance):
+    regressions = []
+    for key, case in cases.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            if not reference[metric]:
+                continue
+            change = (case[metric] - reference[metric]) / reference[metric]
+            if change * direction < -tolerance:
+                regressions.append(f"{key}: {metric} {reference[metric]:.4g} -> {case[metric]:.4g} ({change:+.1%})")
+        if case['udp_loss'] > reference['udp_loss'] + loss_tolerance:
+            regressions.append(f"{key}: udp_loss {reference['udp_loss']:.2%} -> {case['udp_loss']:.2%}")
+        # any new failure counts, whatever it did to throughput
+        if case['failed'] > reference.get('failed', 0):
+            regressions.append(f"{key}: failed transfers {reference.get('failed', 0)} -> {case['failed']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless loopback benchmark of the server and client")
+    parser.add_argument('--engines', type=parse_list(str), default=['thread'], help="thread,asyncio")
+    parser.add_argument('--client-engine', choices=['thread', 'asyncio'], default=Config.CLIENT_ENGINE)
+    parser.add_argument('--chunk-sizes', type=parse_list(int), default=[Config.CHUNK_SIZE], help="UDP payload sizes")
+    parser.add_argument('--send-sizes', type=parse_list(parse_size), default=[Config.TCP_SEND_SIZE],
+                        help="TCP write sizes, K/M suffixes allowed")
+    parser.add_argument('--sizes', type=parse_list(parse_size), default=[parse_size('1M'), parse_size('16M')],
+                        help="file sizes, K/M/G suffixes allowed")
+    parser.add_argument('--tcp', type=parse_list(int), default=[1, 4], help="TCP connection counts")
+    parser.add_argument('--udp', type=parse_list(int), default=[0, 2], help="UDP connection counts")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default='bench_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed relative throughput/p99 change")
+    parser.add_argument('--loss-tolerance', type=float, default=0.01, help="allowed absolute UDP loss increase")
+    args = parser.parse_args()
+
+    unknown = set(args.engines) - set(ENGINES)
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(sorted(unknown))}")
+    largest_chunk = Config.CLIENT_BUFFER_SIZE - PAYLOAD_HEADER.size
+    if any(not 0 < chunk_size <= largest_chunk for chunk_size in args.chunk_sizes):
+        parser.error(f"chunk sizes must be between 1 and {largest_chunk} to fit the client buffer")
+    if any(send_size <= 0 for send_size in args.send_sizes):
+        parser.error("send sizes must be positive")
+
+    Config.CLIENT_ENGINE = args.client_engine
+    log.set_level(QUIET)
+    benchmark = Benchmark(args.engines, args.chunk_sizes, args.send_sizes, args.sizes, args.tcp, args.udp, args.repeat)
+    print(f"{Colors.HEADER}{Colors.BOLD}Benchmark Started{Colors.ENDC}")
+    cases = benchmark.run()
+    report = {'created': time.time(), 'python': sys.version.split()[0], 'repeat': args.repeat, 'cases': cases}
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f"{Colors.BLUE}Results written to {Colors.CYAN}{args.output}{Colors.ENDC}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline:
+            json.dump(report, baseline, indent=2)
+        print(f"{Colors.BLUE}Baseline saved to {Colors.CYAN}{args.baseline}{Colors.ENDC}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"{Colors.YELLOW}No baseline at {args.baseline}, run with --save-baseline to create one{Colors.ENDC}")
+        return 0
+
+    with open(args.baseline) as baseline:
+        regressions = compare(cases, json.load(baseline)['cases'], args.tolerance, args.loss_tolerance)
+    if regressions:
+        print(f"{Colors.RED}{Colors.BOLD}✗ {len(regressions)} regressions against {args.baseline}:{Colors.ENDC}")
+        for regression in regressions:
+            print(f"  {Colors.RED}{regression}{Colors.ENDC}")
+        return 1
+    print(f"{Colors.GREEN}{Colors.BOLD}✓ No regressions against {args.baseline}{Colors.ENDC}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
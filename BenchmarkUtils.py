@@ -0,0 +1,23 @@
+import math
+
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+#'64K', '1.5M', '2GB' or a plain byte count
+def parse_size(text):
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def parse_list(convert):
+    return lambda text: [convert(item) for item in text.split(',') if item.strip()]
+
+
+#nearest-rank percentile, fraction in [0, 1]
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
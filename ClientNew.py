@@ -1,15 +1,29 @@
+import random
 import socket
-import struct
 import threading
 import time
 import sys
+from collections import deque
 from queue import Queue
 from Config import Colors,Config,Format
+from PacketBitmap import PacketBitmap
+from UdpAnalytics import UdpArrivalStats
+from Log import log
+from Protocol import PAYLOAD_HEADER, build_nack, pack_request, parse_payload_header
+from Discovery import OfferListener
+from TcpRequest import TcpRequest, PATTERNS
 
 
 class Client:
-    def __init__(self):
+    def __init__(self, file_size=None, tcp_connections=None, udp_connections=None):
+        """
+        Without parameters the client asks for them on the terminal; with them
+        it can be driven programmatically, see transfer().
+        """
         self.state = "STARTUP"
+        self.file_size = file_size
+        self.tcp_connections = tcp_connections or 0
+        self.udp_connections = udp_connections or 0
         self.current_server = None
         self.transfer_threads = []
         self.transfers_completed = False
@@ -21,51 +35,88 @@ class Client:
         self.failed_transfers = 0
         self.tcp_transfers = 0
         self.udp_transfers = 0
+        # tcp payload kept versus received and then thrown away by a restarted retry
+        self.useful_bytes = 0
+        self.wasted_bytes = 0
+        # one dict per finished transfer, see record_result
+        self.transfer_results = []
+        # segmented mode: the file being reassembled from the TCP connections' ranges
+        self.segmented_file = None
+        self.round_start = 0
+        # seconds from listening to the first offer, in the last round
+        self.time_to_offer = None
 
     def print_statistics(self):
+        log.flush()
         print(f"{Colors.GREEN}{Colors.BOLD}Client Statistics:{Colors.ENDC}")
         print(f"{Colors.BLUE}Total data received: {Colors.CYAN}{Format.format_size(self.total_data_received)}{Colors.ENDC}")
         print(f"{Colors.BLUE}TCP transfers completed: {Colors.CYAN}{self.tcp_transfers}{Colors.ENDC}")
         print(f"{Colors.BLUE}UDP transfers completed: {Colors.CYAN}{self.udp_transfers}{Colors.ENDC}")
+        print(f"{Colors.BLUE}TCP data useful/wasted: {Colors.CYAN}{Format.format_size(self.useful_bytes)}"
+              f" / {Format.format_size(self.wasted_bytes)}{Colors.ENDC}")
         print(f"{Colors.RED}Failed transfers: {Colors.CYAN}{self.failed_transfers}{Colors.ENDC}")
+        if self.time_to_offer is not None:
+            print(f"{Colors.BLUE}Time to first offer: {Colors.CYAN}{self.time_to_offer * 1000:.1f} ms{Colors.ENDC}")
 
+    #one round per offer; interactive clients are asked for new parameters every round
     def run(self):
-        self.get_user_parameters()
+        interactive = self.file_size is None
+        while self.is_running:
+            if interactive:
+                self.get_user_parameters()
+            self.run_round()
 
-        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        udp_socket.bind(("", Config.OFFER_UDP_PORT))
-        udp_socket.settimeout(1)
+    #waits for an offer, soliciting one unless Config.CLIENT_SOLICIT is off, then runs the transfers
+    def run_round(self):
+        listener = OfferListener()
+        start_time = time.monotonic()
 
         print(f"{Colors.BLUE}Client started, listening for offer requests...{Colors.ENDC}")
 
         while not self.transfers_completed and self.is_running:
             try:
-                data, address = udp_socket.recvfrom(Config.CLIENT_BUFFER_SIZE)
-                magic_cookie, message_type, udp_port, tcp_port = struct.unpack('>IBHH', data)
+                server = listener.wait(keep_waiting=lambda: self.is_running)
 
-                if magic_cookie == Config.MAGIC_COOKIE and message_type == Config.OFFER_TYPE:
+                if server:
+                    self.time_to_offer = time.monotonic() - start_time
                     print(
-                        f"  {Colors.BLUE}➜ Received offer from {Colors.CYAN}{address[0]}{Colors.ENDC}\n"
-                        f"  {Colors.BLUE}├─ UDP Port: {Colors.CYAN}{udp_port}{Colors.ENDC}\n"
-                        f"  {Colors.BLUE}└─ TCP Port: {Colors.CYAN}{tcp_port}{Colors.ENDC}\n"
+                        f"  {Colors.BLUE}➜ Received offer from {Colors.CYAN}{server[0]}{Colors.ENDC}\n"
+                        f"  {Colors.BLUE}├─ UDP Port: {Colors.CYAN}{server[1]}{Colors.ENDC}\n"
+                        f"  {Colors.BLUE}├─ TCP Port: {Colors.CYAN}{server[2]}{Colors.ENDC}\n"
+                        f"  {Colors.BLUE}└─ Time to offer: {Colors.CYAN}{self.time_to_offer * 1000:.1f} ms{Colors.ENDC}\n"
                     )
-                    self.current_server = (address[0], udp_port, tcp_port)
+                    self.current_server = server
                     self.start_connections()
                     break  # Exit after completing transfers
 
-            except socket.timeout:
-                continue
             except Exception as e:
-                print(f"{Colors.RED}✗ Error: {e}{Colors.ENDC}")
+                log.error("{RED}✗ Error: {error}{ENDC}", error=e)
                 time.sleep(1)
 
         print(f"{Colors.YELLOW}Client statistics at shutdown:{Colors.ENDC}")
         self.print_statistics()
         print(f"{Colors.YELLOW}Client shutting down its Connection and starting again...{Colors.ENDC}")
-        udp_socket.close()
+        listener.close()
         self.transfers_completed = False
-        self.run()
+
+    #runs one round of transfers against server = (ip, udp_port, tcp_port) without waiting for offers
+    def transfer(self, server):
+        self.current_server = server
+        self.start_connections()
+        return self.transfer_results
+
+    #list.append is atomic, so transfer threads record without a lock
+    def record_result(self, protocol, connection_id, success, bytes_received=0, duration=0.0, **extra):
+        result = {
+            'protocol': protocol,
+            'connection': connection_id,
+            'success': success,
+            'bytes': bytes_received,
+            'duration': duration,
+            'finished_at': time.time(),
+        }
+        result.update(extra)
+        self.transfer_results.append(result)
 
 
     def get_user_parameters(self):
@@ -96,14 +147,103 @@ class Client:
             print(f"{Colors.YELLOW}Client shutdown requested{Colors.ENDC}\n")
             sys.exit(0)
 
+    #(offset, length) per TCP connection: the whole file each, or one slice of it when segmented
+    def tcp_ranges(self):
+        if not Config.TCP_SEGMENTED:
+            return [(0, self.file_size)] * self.tcp_connections
+        count = min(self.tcp_connections, self.file_size)
+        if not count:
+            return []
+        base, extra = divmod(self.file_size, count)
+        ranges = []
+        offset = 0
+        for index in range(count):
+            length = base + (index < extra)
+            ranges.append((offset, length))
+            offset += length
+        return ranges
+
+    #shared by both engines
+    def start_round(self):
+        self.transfer_results = []
+        self.round_start = time.time()
+        self.segmented_file = bytearray(self.file_size) if Config.TCP_SEGMENTED and self.tcp_connections else None
+
+    def finish_round(self):
+        # the round's transfer reports come first
+        log.flush()
+        if self.segmented_file is not None:
+            self.report_segmented_download()
+            self.segmented_file = None
+        print(f"{Colors.GREEN}{Colors.BOLD}✓ All transfers completed successfully!{Colors.ENDC}")
+        self.transfers_completed = True
+
+    #where a segmented transfer receives its range, None when the payload is only counted
+    def segment_view(self, offset, length):
+        if self.segmented_file is None:
+            return None
+        return memoryview(self.segmented_file)[offset:offset + length]
+
+    #request bytes for a range: a binary frame with the configured options, or the legacy ascii line
+    @staticmethod
+    def tcp_request(offset, length, keep_alive=False):
+        request = TcpRequest(length, offset, keep_alive, Config.TCP_REQUEST_CHUNK_SIZE, Config.TCP_REQUEST_RATE,
+                             PATTERNS[Config.TCP_REQUEST_PATTERN])
+        return request.encode() if Config.TCP_BINARY_REQUESTS else request.encode_ascii()
+
+    #keep-alive sessions replace one-shot transfers, except for segmented downloads
+    def keep_alive_mode(self):
+        return Config.TCP_KEEPALIVE_REQUESTS > 0 and self.segmented_file is None
+
+    #exponential backoff before retry number retry + 1, jittered over its upper half
+    @staticmethod
+    def retry_delay(retry):
+        delay = min(Config.TCP_RETRY_BACKOFF_MAX, Config.TCP_RETRY_BACKOFF * 2 ** retry)
+        return random.uniform(delay / 2, delay)
+
+    #called before every retry: how much of the range to keep, counting what is thrown away
+    def bytes_to_keep(self, connection_id, received):
+        if Config.TCP_RESUME:
+            if received:
+                log.warning(self.format_resume, connection_id=connection_id, received=received)
+            else:
+                log.warning("{YELLOW}Retrying TCP transfer #{connection_id}...{ENDC}", connection_id=connection_id)
+            return received
+        log.warning("{YELLOW}Retrying TCP transfer #{connection_id}...{ENDC}", connection_id=connection_id)
+        self.wasted_bytes += received
+        return 0
+
+    @staticmethod
+    def format_resume(connection_id, received):
+        return f"{Colors.YELLOW}Resuming TCP transfer #{connection_id} after {Format.format_size(received)}...{Colors.ENDC}"
+
+    def report_segmented_download(self):
+        segments = [result for result in self.transfer_results if result['protocol'] == 'tcp' and result['success']]
+        expected = len(self.tcp_ranges())
+        received = sum(result['bytes'] for result in segments)
+        duration = max((result['finished_at'] for result in segments), default=self.round_start) - self.round_start
+        speed = (received * 8) / duration if duration > 0 else 0
+        complete = len(segments) == expected and received == self.file_size
+        status = (f"{Colors.GREEN}✓ Segmented download complete" if complete
+                  else f"{Colors.RED}✗ Segmented download incomplete")
+        print(
+            f"  {status}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ File size: {Colors.CYAN}{Format.format_size(self.file_size)}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Segments: {Colors.CYAN}{len(segments)}/{expected}"
+            f" ({Format.format_size(received)}){Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Time to complete: {Colors.CYAN}{duration:.2f}s{Colors.ENDC}\n"
+            f"  {Colors.BLUE}└─ Speed: {Colors.CYAN}{Format.format_speed(speed)}{Colors.ENDC}\n"
+        )
+
     def start_connections(self):
         self.transfer_threads = []
+        self.start_round()
 
         # Start TCP transfers
-        for i in range(self.tcp_connections):
+        for i, (offset, length) in enumerate(self.tcp_ranges()):
             thread = threading.Thread(
-                target=self.handle_tcp_transfer,
-                args=(self.current_server[0], self.current_server[2], i + 1)
+                target=self.handle_tcp_session if self.keep_alive_mode() else self.handle_tcp_transfer,
+                args=(self.current_server[0], self.current_server[2], i + 1, offset, length)
             )
             self.transfer_threads.append(thread)
             thread.start()
@@ -121,117 +261,418 @@ class Client:
         for thread in self.transfer_threads:
             thread.join()
 
-        print(f"{Colors.GREEN}{Colors.BOLD}✓ All transfers completed successfully!{Colors.ENDC}")
-        self.transfers_completed = True
-
-    def handle_tcp_transfer(self, server_ip, tcp_port, connection_id):
+        self.finish_round()
+
+    def handle_tcp_transfer(self, server_ip, tcp_port, connection_id, offset, length):
+        start_time = time.time()
+        # payload is only counted, so every read reuses the same buffer; segments land in place
+        segment = self.segment_view(offset, length)
+        buffer = bytearray(Config.CLIENT_TCP_RECV_SIZE) if segment is None else None
+        bytes_received = 0
+        recv_calls = 0
+        wasted = 0
+        completed = False
         for retry in range(Config.MAX_RETRIES):
+            if retry:
+                time.sleep(self.retry_delay(retry - 1))
+                kept = self.bytes_to_keep(connection_id, bytes_received)
+                wasted += bytes_received - kept
+                bytes_received = kept
             tcp_socket = None
             try:
-                start_time = time.time()
                 tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                if Config.CLIENT_TCP_RCVBUF:
+                    # must be set before connect for the window scale to take it into account
+                    tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, Config.CLIENT_TCP_RCVBUF)
                 timeout = 1.0 + retry * 0.5
                 tcp_socket.settimeout(timeout)
 
-                print(f"{Colors.BLUE}Starting TCP transfer #{connection_id}...{Colors.ENDC}")
+                if not retry:
+                    log.info("{BLUE}Starting TCP transfer #{connection_id}...{ENDC}", connection_id=connection_id)
                 tcp_socket.connect((server_ip, tcp_port))
                 self.tcp_transfers+=1
-                tcp_socket.sendall(f"{self.file_size}\n".encode())
+                tcp_socket.sendall(self.tcp_request(offset + bytes_received, length - bytes_received))
 
-                bytes_received = 0
-                while bytes_received < self.file_size and self.is_running:
-                    chunk = tcp_socket.recv(Config.CLIENT_BUFFER_SIZE)
-                    if not chunk:
-                        if bytes_received < self.file_size:
+                while bytes_received < length and self.is_running:
+                    size = tcp_socket.recv_into(buffer if segment is None else segment[bytes_received:])
+                    recv_calls += 1
+                    if not size:
+                        if bytes_received < length:
                             raise ConnectionError("Server closed connection prematurely")
                         break
-                    bytes_received += len(chunk)
-
-
-                end_time = time.time()
-                duration = end_time - start_time
-                speed = (bytes_received * 8) / duration if duration > 0 else 0
-                self.total_data_received+=bytes_received
-
-                print(
-                    f"  {Colors.GREEN}✓ TCP transfer #{connection_id} complete{Colors.ENDC}\n"
-                    f"  {Colors.BLUE}├─ Received: {Colors.CYAN}{Format.format_size(bytes_received)}{Colors.ENDC}\n"
-                    f"  {Colors.BLUE}├─ Time: {Colors.CYAN}{duration:.2f}s{Colors.ENDC}\n"
-                    f"  {Colors.BLUE}└─ Speed: {Colors.CYAN}{Format.format_speed(speed)}{Colors.ENDC}\n"
-                )
+                    bytes_received += size
+                completed = True
                 break
 
             except Exception as e:
-                print(f"{Colors.RED}✗ TCP transfer #{connection_id} error: {e}{Colors.ENDC}")
+                log.error("{RED}✗ TCP transfer #{connection_id} error: {error}{ENDC}", connection_id=connection_id, error=e)
                 self.failed_transfers+=1
-                if retry < Config.MAX_RETRIES - 1:
-                    print(f"{Colors.YELLOW}Retrying TCP transfer #{connection_id}...{Colors.ENDC}")
-                    time.sleep(1)
             finally:
                 if tcp_socket:
                     tcp_socket.close()
 
+        self.finish_tcp_transfer(connection_id, completed, bytes_received, time.time() - start_time, recv_calls,
+                                 offset, retry, wasted)
+
+    #shared by both engines; retries and wasted bytes cover every attempt
+    def finish_tcp_transfer(self, connection_id, completed, bytes_received, duration, recv_calls, offset, retries,
+                            wasted):
+        if not completed:
+            # a transfer that never completed delivered nothing useful
+            self.wasted_bytes += bytes_received
+            self.record_result('tcp', connection_id, False, bytes_received, duration, retries=retries,
+                               wasted=wasted + bytes_received)
+            return
+        self.useful_bytes += bytes_received
+        self.report_tcp_transfer(connection_id, bytes_received, duration, recv_calls, offset, retries, wasted)
+
+    #shared by both engines
+    def report_tcp_transfer(self, connection_id, bytes_received, duration, recv_calls, offset=0, retries=0, wasted=0):
+        self.total_data_received+=bytes_received
+        log.info(self.format_tcp_transfer, connection_id=connection_id, bytes_received=bytes_received,
+                 duration=duration, recv_calls=recv_calls, retries=retries, wasted=wasted)
+        self.record_result('tcp', connection_id, True, bytes_received, duration, recv_calls=recv_calls, offset=offset,
+                           retries=retries, wasted=wasted)
+
+    #reports are rendered by the log writer from plain fields, so a quiet log skips the formatting
+    @staticmethod
+    def format_tcp_transfer(connection_id, bytes_received, duration, recv_calls, retries, wasted):
+        speed = (bytes_received * 8) / duration if duration > 0 else 0
+        bytes_per_call = bytes_received / recv_calls if recv_calls else 0
+        retry_line = ""
+        if retries:
+            retry_line = (f"  {Colors.BLUE}├─ Retries: {Colors.CYAN}{retries}"
+                          f" ({Format.format_size(wasted)} wasted){Colors.ENDC}\n")
+
+        return (
+            f"  {Colors.GREEN}✓ TCP transfer #{connection_id} complete{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Received: {Colors.CYAN}{Format.format_size(bytes_received)}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Time: {Colors.CYAN}{duration:.2f}s{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Speed: {Colors.CYAN}{Format.format_speed(speed)}{Colors.ENDC}\n"
+            f"{retry_line}"
+            f"  {Colors.BLUE}└─ Receive syscalls: {Colors.CYAN}{recv_calls}"
+            f" ({Format.format_size(bytes_per_call)} per call){Colors.ENDC}\n"
+        )
+
+    #keep-alive mode: every request on one connection, up to TCP_PIPELINE_DEPTH of them in flight
+    def handle_tcp_session(self, server_ip, tcp_port, connection_id, offset, length):
+        tcp_socket = None
+        try:
+            session = TcpSession(length)
+            tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if Config.CLIENT_TCP_RCVBUF:
+                tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, Config.CLIENT_TCP_RCVBUF)
+            # pipelined request lines go out as they are queued
+            tcp_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            tcp_socket.settimeout(Config.TIMEOUT)
+
+            log.info("{BLUE}Starting TCP session #{connection_id}...{ENDC}", connection_id=connection_id)
+            tcp_socket.connect((server_ip, tcp_port))
+            self.tcp_transfers+=1
+            request = self.tcp_request(offset, length, keep_alive=True)
+            buffer = bytearray(Config.CLIENT_TCP_RECV_SIZE)
+
+            while not session.done() and self.is_running:
+                pending = session.requests_to_send()
+                if pending:
+                    tcp_socket.sendall(request * pending)
+                size = tcp_socket.recv_into(buffer)
+                if not size:
+                    raise ConnectionError("Server closed connection prematurely")
+                session.on_data(size)
+
+            self.report_tcp_session(connection_id, session)
+
+        except Exception as e:
+            log.error("{RED}✗ TCP session #{connection_id} error: {error}{ENDC}", connection_id=connection_id, error=e)
+            self.failed_transfers+=1
+            self.record_result('tcp', connection_id, False)
+        finally:
+            if tcp_socket:
+                tcp_socket.close()
+
+    #shared by both engines
+    def report_tcp_session(self, connection_id, session):
+        duration = session.end_time - session.start_time
+        steady_speed = session.steady_state_speed()
+        latency_average = sum(session.latencies) / len(session.latencies)
+        latency_max = max(session.latencies)
+        self.total_data_received+=session.bytes_received
+        self.useful_bytes += session.bytes_received
+
+        log.info(self.format_tcp_session, connection_id=connection_id, requests=len(session.latencies),
+                 depth=session.depth, bytes_received=session.bytes_received, duration=duration,
+                 first_response=session.first_response_at - session.start_time, latency_average=latency_average,
+                 latency_max=latency_max, steady_speed=steady_speed, recv_calls=session.recv_calls)
+        self.record_result('tcp', connection_id, True, session.bytes_received, duration,
+                           recv_calls=session.recv_calls, requests=len(session.latencies),
+                           latency_average=latency_average, latency_max=latency_max, steady_state_speed=steady_speed)
+
+    @staticmethod
+    def format_tcp_session(connection_id, requests, depth, bytes_received, duration, first_response, latency_average,
+                           latency_max, steady_speed, recv_calls):
+        speed = (bytes_received * 8) / duration if duration > 0 else 0
+        return (
+            f"  {Colors.GREEN}✓ TCP session #{connection_id} complete{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Requests: {Colors.CYAN}{requests} (pipeline depth {depth}){Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Received: {Colors.CYAN}{Format.format_size(bytes_received)}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Time: {Colors.CYAN}{duration:.2f}s{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Speed: {Colors.CYAN}{Format.format_speed(speed)}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ First response: {Colors.CYAN}{first_response:.3f}s{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Request latency avg/max: {Colors.CYAN}{latency_average * 1000:.2f} ms"
+            f" / {latency_max * 1000:.2f} ms{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Steady-state speed: {Colors.CYAN}{Format.format_speed(steady_speed)}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}└─ Receive syscalls: {Colors.CYAN}{recv_calls}{Colors.ENDC}\n"
+        )
+
+    #shared by both engines: a deeper socket buffer absorbs the server's bursts while the receiver catches up
+    @staticmethod
+    def set_udp_receive_buffer(udp_socket):
+        if Config.CLIENT_UDP_RCVBUF:
+            udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, Config.CLIENT_UDP_RCVBUF)
+
     def handle_udp_transfer(self, server_ip, udp_port, connection_id):
+        udp_socket = None
         try:
-            start_time = time.time()
+            transfer = UdpTransfer(time.time())
             udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            udp_socket.settimeout(1)
+            self.set_udp_receive_buffer(udp_socket)
+            udp_socket.settimeout(transfer.quiet_timeout)
+            address = (server_ip, udp_port)
 
-            print(f"{Colors.BLUE}Starting UDP transfer #{connection_id}...{Colors.ENDC}")
+            log.info("{BLUE}Starting UDP transfer #{connection_id}...{ENDC}", connection_id=connection_id)
             self.udp_transfers+=1
-            request = struct.pack(Config.REQUEST_STRUCT_FORMAT, Config.MAGIC_COOKIE,Config.REQUEST_TYPE, self.file_size)
-            udp_socket.sendto(request, (server_ip, udp_port))
-            received_packets = set()
-            total_packets = None
-            bytes_received = 0
+            udp_socket.sendto(transfer.request(self.file_size), address)
+            # every datagram lands in the same buffer, arrivals are one bit each
+            buffer = bytearray(Config.CLIENT_BUFFER_SIZE)
 
             while self.is_running:
                 try:
-                    data, _ = udp_socket.recvfrom(Config.CLIENT_BUFFER_SIZE)
-                    if len(data) < struct.calcsize(Config.PAYLOAD_STRUCT_FORMAT):
-                        continue
-
-                    header = data[:struct.calcsize(Config.PAYLOAD_STRUCT_FORMAT)]
-                    payload = data[struct.calcsize(Config.PAYLOAD_STRUCT_FORMAT):]
-                    magic_cookie, message_type, total_packets, packet_number = struct.unpack(
-                        Config.PAYLOAD_STRUCT_FORMAT, header
-                    )
-                    if magic_cookie != Config.MAGIC_COOKIE or message_type != Config.PAYLOAD_TYPE:
-                        continue
-
-                    received_packets.add(packet_number)
-                    bytes_received += len(payload)
-
-
+                    size = udp_socket.recv_into(buffer)
+                    message = transfer.on_datagram(buffer, size)
                 except socket.timeout:
-                    if total_packets and len(received_packets) == total_packets:
-                        break
-                    if time.time() - start_time > Config.TIMEOUT:
+                    message, finished = transfer.on_quiet()
+                    if message:
+                        udp_socket.sendto(message, address)
+                    if finished:
                         break
+                    continue
+                if message:
+                    udp_socket.sendto(message, address)
 
-            end_time = time.time()
-            duration = end_time - start_time
-            speed = (bytes_received * 8) / duration if duration > 0 else 0
-            self.total_data_received+=bytes_received
-
-            if total_packets:
-                success_rate = (len(received_packets) / total_packets) * 100
-                print(
-                    f"  {Colors.GREEN}✓ UDP transfer #{connection_id} complete{Colors.ENDC}\n"
-                    f"  {Colors.BLUE}├─ Received: {Colors.CYAN}{Format.format_size(bytes_received)}{Colors.ENDC}\n"
-                    f"  {Colors.BLUE}├─ Time: {Colors.CYAN}{duration:.2f}s{Colors.ENDC}\n"
-                    f"  {Colors.BLUE}├─ Speed: {Colors.CYAN}{Format.format_speed(speed)}{Colors.ENDC}\n"
-                    f"  {Colors.BLUE}└─ Success rate: {Colors.CYAN}{success_rate:.1f}%{Colors.ENDC}\n"
-                )
+            self.report_udp_transfer(connection_id, transfer, time.time())
 
         except Exception as e:
-            print(f"{Colors.RED}✗ UDP transfer #{connection_id} error: {e}{Colors.ENDC}\n")
+            log.error("{RED}✗ UDP transfer #{connection_id} error: {error}{ENDC}\n", connection_id=connection_id, error=e)
             self.failed_transfers+=1
+            self.record_result('udp', connection_id, False, loss=1.0)
         finally:
-            udp_socket.close()
+            if udp_socket:
+                udp_socket.close()
+
+    #shared by both engines
+    def report_udp_transfer(self, connection_id, transfer, end_time):
+        duration = end_time - transfer.start_time
+        self.total_data_received+=transfer.bytes_received
+        transfer.record_loss_bursts()
+        arrivals = transfer.analytics.summary()
+
+        if transfer.total_packets:
+            lost = sum(transfer.analytics.loss_bursts)
+            log.info(self.format_udp_transfer, connection_id=connection_id, bytes_received=transfer.bytes_received,
+                     duration=duration, success_rate=(len(transfer.received_packets) / transfer.total_packets) * 100,
+                     goodput=(transfer.unique_bytes * 8) / duration if transfer.reliable and duration > 0 else None,
+                     nack_rounds=transfer.nack_rounds, duplicate_bytes=transfer.bytes_received - transfer.unique_bytes,
+                     arrivals=arrivals, lost=lost, bursts=transfer.analytics.burst_distribution(),
+                     cause=transfer.analytics.loss_cause(lost))
+        received = len(transfer.received_packets) if transfer.received_packets else 0
+        # the receive loop only ends after a quiet timeout, which is not part of the transfer
+        self.record_result('udp', connection_id, bool(transfer.total_packets), transfer.bytes_received,
+                           transfer.last_arrival - transfer.start_time,
+                           total_packets=transfer.total_packets or 0, received_packets=received,
+                           loss=1 - received / transfer.total_packets if transfer.total_packets else 1.0,
+                           **arrivals)
+
+    #goodput is None for best-effort transfers
+    @staticmethod
+    def format_udp_transfer(connection_id, bytes_received, duration, success_rate, goodput, nack_rounds,
+                            duplicate_bytes, arrivals, lost, bursts, cause):
+        speed = (bytes_received * 8) / duration if duration > 0 else 0
+        reliable_lines = ""
+        if goodput is not None:
+            reliable_lines = (
+                f"  {Colors.BLUE}├─ Goodput: {Colors.CYAN}{Format.format_speed(goodput)}{Colors.ENDC}\n"
+                f"  {Colors.BLUE}├─ NACK rounds: {Colors.CYAN}{nack_rounds}{Colors.ENDC}\n"
+                f"  {Colors.BLUE}├─ Duplicate data: {Colors.CYAN}{Format.format_size(duplicate_bytes)}{Colors.ENDC}\n"
+            )
+        return (
+            f"  {Colors.GREEN}✓ UDP transfer #{connection_id} complete{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Received: {Colors.CYAN}{Format.format_size(bytes_received)}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Time: {Colors.CYAN}{duration:.2f}s{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Speed: {Colors.CYAN}{Format.format_speed(speed)}{Colors.ENDC}\n"
+            f"{reliable_lines}"
+            f"{Client.format_arrival_analytics(arrivals, lost, bursts, cause)}"
+            f"  {Colors.BLUE}└─ Success rate: {Colors.CYAN}{success_rate:.1f}%{Colors.ENDC}\n"
+        )
+
+    #bursts maps burst length to count, see UdpArrivalStats.burst_distribution
+    @staticmethod
+    def format_arrival_analytics(arrivals, lost, bursts, cause):
+        bursts = ', '.join(f"{length}{'+' if length > 1 else ''}: {count}" for length, count in bursts.items())
+        lines = (
+            f"  {Colors.BLUE}├─ Jitter: {Colors.CYAN}{arrivals['jitter'] * 1000:.3f} ms"
+            f" (gap p50 {arrivals['gap_p50'] * 1000:.3f} ms, max {arrivals['gap_max'] * 1000:.1f} ms){Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Reordered: {Colors.CYAN}{arrivals['reordered']}"
+            f" (max depth {arrivals['reorder_depth_max']}), {arrivals['duplicates']} duplicates{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Loss bursts: {Colors.CYAN}{arrivals['loss_bursts']}"
+            f" ({lost} packets, longest {arrivals['loss_burst_max']}){Colors.ENDC}\n"
+        )
+        if bursts:
+            lines += f"  {Colors.BLUE}├─ Burst lengths: {Colors.CYAN}{bursts}{Colors.ENDC}\n"
+        if arrivals['rcvbuf_errors'] is not None:
+            lines += f"  {Colors.BLUE}├─ Receive buffer drops (host): {Colors.CYAN}{arrivals['rcvbuf_errors']}{Colors.ENDC}\n"
+        if cause:
+            lines += f"  {Colors.BLUE}├─ Likely loss cause: {Colors.CYAN}{cause}{Colors.ENDC}\n"
+        return lines
+
+
+class TcpSession:
+    """
+    Bookkeeping for one keep-alive connection, shared by both client engines:
+    how many requests to put on the wire and when each response completed.
+    Responses come back in request order, so byte counts alone mark their ends.
+    """
+
+    def __init__(self, length):
+        self.length = length
+        self.total_requests = Config.TCP_KEEPALIVE_REQUESTS
+        self.depth = max(1, Config.TCP_PIPELINE_DEPTH)
+        self.start_time = time.time()
+        self.end_time = self.start_time
+        self.first_response_at = None
+        self.sent_at = deque()
+        self.issued = 0
+        self.bytes_received = 0
+        self.recv_calls = 0
+        self.latencies = []
+
+    def done(self):
+        return len(self.latencies) >= self.total_requests
+
+    #how many requests to send now to keep depth of them outstanding
+    def requests_to_send(self):
+        count = min(self.depth - len(self.sent_at), self.total_requests - self.issued)
+        if count <= 0:
+            return 0
+        now = time.time()
+        self.sent_at.extend([now] * count)
+        self.issued += count
+        return count
+
+    def on_data(self, size, recv_calls=1):
+        now = time.time()
+        self.bytes_received += size
+        self.recv_calls += recv_calls
+        self.end_time = now
+        while self.sent_at and self.bytes_received >= (len(self.latencies) + 1) * self.length:
+            self.latencies.append(now - self.sent_at.popleft())
+            if self.first_response_at is None:
+                self.first_response_at = now
+
+    #throughput after the first response, which paid for the handshake and slow start
+    def steady_state_speed(self):
+        duration = self.end_time - self.first_response_at
+        steady_bytes = self.bytes_received - self.length
+        return (steady_bytes * 8) / duration if duration > 0 and steady_bytes > 0 else 0
+
+
+class UdpTransfer:
+    """
+    Receive side of one UDP transfer, shared by both client engines: arrival
+    bitmap, byte counts and, in reliable mode, when to send progress reports
+    and NACKs. The engines only move datagrams and send what it returns.
+    """
+
+    def __init__(self, start_time):
+        self.start_time = start_time
+        self.reliable = Config.UDP_RELIABLE
+        self.quiet_timeout = Config.UDP_NACK_INTERVAL if self.reliable else 1
+        self.received_packets = None
+        self.total_packets = None
+        self.bytes_received = 0
+        self.unique_bytes = 0
+        self.nack_rounds = 0
+        self.idle_rounds = 0
+        self.received_at_last_nack = 0
+        self.last_arrival = start_time
+        self.next_feedback = start_time + Config.UDP_FEEDBACK_INTERVAL
+        self.analytics = UdpArrivalStats()
+
+    @staticmethod
+    def request(file_size):
+        return pack_request(file_size)
+
+    #reliable mode: reports missing segments so the server resends only those
+    def nack(self):
+        self.record_loss_bursts()
+        ranges = self.received_packets.missing_ranges(Config.UDP_NACK_MAX_RANGES)
+        return build_nack(self.received_packets.highest, len(self.received_packets), ranges)
+
+    #counts one datagram of size bytes from buffer, returns a progress report to send or None
+    def on_datagram(self, buffer, size):
+        header = parse_payload_header(buffer, size)
+        if header is None:
+            return None
+        packet_total, packet_number = header
+        if self.received_packets is None:
+            self.total_packets = packet_total
+            self.received_packets = PacketBitmap(packet_total)
+
+        arrival_ns = time.monotonic_ns()
+        self.last_arrival = time.time()
+        payload_size = size - PAYLOAD_HEADER.size
+        new = self.received_packets.add(packet_number)
+        self.analytics.on_arrival(packet_number, arrival_ns, new, not self.nack_rounds)
+        if new:
+            self.unique_bytes += payload_size
+        self.bytes_received += payload_size
+
+        # progress reports drive the server's adaptive pacing
+        if self.reliable and self.last_arrival >= self.next_feedback:
+            self.next_feedback = self.last_arrival + Config.UDP_FEEDBACK_INTERVAL
+            return build_nack(self.received_packets.highest, len(self.received_packets), [])
+        return None
+
+    #loss bursts of the first pass: taken before the first NACK, or at the end without any
+    def record_loss_bursts(self):
+        if self.received_packets and not self.analytics.bursts_recorded:
+            self.analytics.record_loss_bursts(self.received_packets.missing_ranges(None))
+
+    #after quiet_timeout without datagrams: (message to send or None, whether the transfer is over)
+    def on_quiet(self):
+        if self.received_packets and self.received_packets.is_complete():
+            # acknowledges the transfer so the server can stop lingering
+            return (self.nack() if self.reliable else None), True
+        if self.reliable and self.received_packets:
+            received = len(self.received_packets)
+            self.idle_rounds = 0 if received > self.received_at_last_nack else self.idle_rounds + 1
+            if self.idle_rounds < Config.UDP_NACK_ROUNDS:
+                self.received_at_last_nack = received
+                self.nack_rounds += 1
+                return self.nack(), False
+            return None, True
+        return None, time.time() - self.start_time > Config.TIMEOUT
+
+
+#the client for Config.CLIENT_ENGINE
+def create_client(*args, **kwargs):
+    if Config.CLIENT_ENGINE == 'asyncio':
+        from AsyncClient import AsyncClient
+        return AsyncClient(*args, **kwargs)
+    return Client(*args, **kwargs)
 
 
 if __name__ == "__main__":
-    client = Client()
+    client = create_client()
     print(f"{Colors.HEADER}{Colors.BOLD}Client Started{Colors.ENDC}")
-    client.run()
\ No newline at end of file
+    client.run()
@@ -0,0 +1,59 @@
+import threading
+from Config import Config
+
+TCP = 0
+UDP = 1
+CONNECTION_TYPES = {'tcp': TCP, 'udp': UDP}
+
+
+class ClientRegistry:
+    """
+    Per-client [tcp, udp] connection counts kept in this process and spread
+    over lock stripes, so concurrent track/untrack calls for different
+    clients rarely contend.
+    """
+
+    def __init__(self, stripes=Config.CLIENT_REGISTRY_STRIPES):
+        self.stripes = [({}, threading.Lock()) for _ in range(stripes)]
+
+    def stripe(self, client_address):
+        return self.stripes[hash(client_address) % len(self.stripes)]
+
+    def __len__(self):
+        return sum(len(clients) for clients, _ in self.stripes)
+
+    def __contains__(self, client_address):
+        clients, _ = self.stripe(client_address)
+        return client_address in clients
+
+    def track(self, client_address, conn_type):
+        clients, lock = self.stripe(client_address)
+        with lock:
+            counts = clients.get(client_address)
+            if counts is None:
+                counts = clients[client_address] = [0, 0]
+            counts[CONNECTION_TYPES[conn_type]] += 1
+
+    def untrack(self, client_address, conn_type):
+        clients, lock = self.stripe(client_address)
+        with lock:
+            counts = clients.get(client_address)
+            if counts is None:
+                return
+            counts[CONNECTION_TYPES[conn_type]] -= 1
+            if not any(counts):
+                del clients[client_address]
+
+    #point-in-time copy taken with every stripe locked: {address: {'tcp_count': n, 'udp_count': m}}
+    def snapshot(self):
+        for _, lock in self.stripes:
+            lock.acquire()
+        try:
+            return {
+                client_address: {'tcp_count': counts[TCP], 'udp_count': counts[UDP]}
+                for clients, _ in self.stripes
+                for client_address, counts in clients.items()
+            }
+        finally:
+            for _, lock in self.stripes:
+                lock.release()
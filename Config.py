@@ -1,3 +1,6 @@
+import os
+
+
 
 class Config:
     MAGIC_COOKIE = 0xabcddcba
@@ -5,22 +8,121 @@ class Config:
     OFFER_TYPE = 0x2
     REQUEST_TYPE=0x3
     PAYLOAD_TYPE=0x4
+    NACK_TYPE=0x5
+    TCP_REQUEST_TYPE=0x6
+    SOLICIT_TYPE=0x7
+    TCP_REQUEST_VERSION=1
 
     OFFER_STRUCT_FORMAT="!IBHH"
+    SOLICIT_STRUCT_FORMAT="!IB"
     REQUEST_STRUCT_FORMAT="!IBQ"
     PAYLOAD_STRUCT_FORMAT="!IBQQ"
+    # highest segment seen, segments received, number of ranges; then (first missing, count) per range
+    NACK_STRUCT_FORMAT="!IBQQH"
+    NACK_RANGE_FORMAT="!QI"
+    # version, flags, payload pattern, length, offset, chunk size, pacing rate (bytes/s)
+    TCP_REQUEST_STRUCT_FORMAT="!IBBBBQQIQ"
 
     OFFER_UDP_PORT = 13117
+    # active discovery: clients solicit on this port and servers answer with a unicast offer right away
+    SOLICIT_UDP_PORT = 13118
+    CLIENT_SOLICIT = True
+    SOLICIT_INTERVAL = 0.25  # solicit again while no offer has arrived
+    # multicast group (e.g. '239.255.31.17') used instead of subnet broadcast, for routed networks
+    OFFER_MULTICAST_GROUP = None
+    OFFER_MULTICAST_TTL = 4
 
     CLIENT_BUFFER_SIZE = 4096
+    CLIENT_TCP_RECV_SIZE = 1024 * 1024
+    CLIENT_TCP_RCVBUF = 4 * 1024 * 1024  # 0 keeps the OS default
+    CLIENT_UDP_RCVBUF = 4 * 1024 * 1024  # absorbs the server's bursts; 0 keeps the OS default
+    CLIENT_ENGINE = 'thread'  # 'asyncio' runs all of a client's transfers on one event loop
     SERVER_BUFFER_SIZE = 4096
 
     MAX_CLIENTS=5
+    CLIENT_REGISTRY_STRIPES = 16
+
+    # multi-process server (ServerCluster)
+    SERVER_WORKERS = os.cpu_count() or 1
+    CLUSTER_STATS_INTERVAL = 1
+
+    # prometheus text endpoint on METRICS_HOST:METRICS_PORT/metrics, None disables it
+    METRICS_HOST = '127.0.0.1'
+    METRICS_PORT = None
+    # transfer timing histograms: relative error under 2**-(bits - 1), values clamped at 2**HISTOGRAM_MAX_BITS ns
+    HISTOGRAM_SIGNIFICANT_BITS = 7
+    HISTOGRAM_MAX_BITS = 42
+    THROUGHPUT_SERIES_SECONDS = 300
+
+    # per-transfer events go through Log.log: 'debug', 'info', 'warning', 'error' or 'quiet'
+    LOG_LEVEL = 'info'
+    LOG_FORMAT = 'plain'  # 'json' writes one object per line
+    LOG_QUEUE_SIZE = 10000  # events beyond this are dropped and counted
+    LOG_FLUSH_INTERVAL = 0.05
+    LOG_COLOR = None  # None colors only when writing to a terminal
+
+    # elastic tcp worker pool
+    POOL_MIN_WORKERS = 5
+    POOL_MAX_WORKERS = 64
+    POOL_QUEUE_SIZE = 256
+    POOL_IDLE_TIMEOUT = 30  # seconds before an idle worker above the minimum exits
+    POOL_WAIT_THRESHOLD = 0.05  # queue wait (seconds) that justifies another worker
+    POOL_SUBMIT_TIMEOUT = 1.0
     CHUNK_SIZE = 1024
     MAX_RETRIES=3
+    TCP_RESUME = True  # a retried TCP transfer asks only for the bytes it is still missing
+    TCP_RETRY_BACKOFF = 0.5  # seconds before the first retry, doubling per retry, with jitter
+    TCP_RETRY_BACKOFF_MAX = 8.0
 
     TIMEOUT=3
 
+    # udp sessions get this many segments per scheduler turn
+    UDP_BURST_SEGMENTS = 64
+    # datagrams handed to the kernel per sendmmsg() call
+    UDP_BATCH_SIZE = 64
+    # memory ceilings for buffered udp segments, per session and for the whole server
+    UDP_SESSION_MEMORY = 64 * 1024
+    UDP_SERVER_MEMORY = 16 * 1024 * 1024
+
+    # reliable udp: client NACKs missing segments, server resends only those
+    UDP_RELIABLE = False
+    UDP_NACK_INTERVAL = 0.2  # client quiet time before it reports losses
+    UDP_NACK_ROUNDS = 10  # rounds without progress before the client gives up
+    UDP_NACK_MAX_RANGES = 64
+    UDP_NACK_LINGER = 1.0  # how long the server keeps a finished session for NACKs
+    UDP_FEEDBACK_INTERVAL = 0.05  # reliable client progress reports while receiving
+
+    # udp pacing, bytes per second (0 disables)
+    UDP_SESSION_RATE = 0
+    UDP_SERVER_RATE = 0
+    UDP_PACING_BURST = 64 * 1024
+    # adaptive pacing from reliable-mode feedback
+    UDP_AIMD = False
+    UDP_AIMD_START_RATE = 10 * 1024 * 1024
+    UDP_AIMD_MIN_RATE = 256 * 1024
+    UDP_AIMD_MAX_RATE = 1024 * 1024 * 1024
+    UDP_AIMD_INCREASE = 1024 * 1024
+    UDP_AIMD_DECREASE = 0.5
+    UDP_AIMD_LOSS_THRESHOLD = 0.01
+
+    # tcp payload path
+    TCP_SEND_SIZE = 256 * 1024
+    TCP_RATE_LIMIT = 0  # bytes per second, 0 sends as fast as the link allows
+    TCP_PACING_INTERVAL = 0.02  # paced transfers write at most this many seconds' worth of bytes at a time
+    TCP_USE_SENDFILE = False  # serve the payload with sendfile() from an in-memory file
+    TCP_SEGMENTED = False  # client splits one file_size download into ranges across its TCP connections
+    TCP_KEEPALIVE_TIMEOUT = 5  # seconds a keep-alive connection may sit idle between requests
+    TCP_KEEPALIVE_REQUESTS = 0  # client: requests per TCP connection in keep-alive mode, 0 for one-shot
+    TCP_PIPELINE_DEPTH = 1  # client: keep-alive requests kept outstanding before reading
+    TCP_BINARY_REQUESTS = False  # client: binary request frames; ascii lines also work with legacy servers
+    TCP_REQUEST_CHUNK_SIZE = 0  # client, binary only: server send size, 0 for the server's default
+    TCP_REQUEST_RATE = 0  # client, binary only: bytes per second, 0 for unpaced
+    TCP_REQUEST_PATTERN = 'A'  # client, binary only: 'A', 'zero', 'sequence' or 'random'
+
+    # asyncio engine
+    ASYNC_BACKLOG = 1024
+    ASYNC_WRITE_HIGH_WATER = 256 * 1024
+
 class Colors:
     HEADER = '\033[95m'  # Pink
     BLUE = '\033[94m'  # Blue
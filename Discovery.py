@@ -0,0 +1,108 @@
+import select
+import socket
+import sys
+import time
+from Config import Colors, Config
+from Protocol import pack_solicit, parse_offer
+
+
+#where offers and solicitations go: the multicast group when one is configured, else subnet broadcast
+def announce_address(port):
+    return (Config.OFFER_MULTICAST_GROUP or '<broadcast>', port)
+
+
+#lets udp_socket send to the announce address
+def enable_announcing(udp_socket):
+    if Config.OFFER_MULTICAST_GROUP:
+        udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, Config.OFFER_MULTICAST_TTL)
+    else:
+        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+
+#a udp socket bound to port that several processes can share and that receives the multicast group
+def open_listener(port):
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    udp_socket.bind(("", port))
+    if Config.OFFER_MULTICAST_GROUP:
+        membership = socket.inet_aton(Config.OFFER_MULTICAST_GROUP) + socket.inet_aton('0.0.0.0')
+        udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    return udp_socket
+
+
+class OfferListener:
+    """
+    Client side of discovery. Periodic offers arrive on the shared
+    OFFER_UDP_PORT; solicitations go out from a socket of their own, so
+    the unicast answers reach this client even when several share a host.
+    """
+
+    def __init__(self, solicit=None):
+        self.solicit = Config.CLIENT_SOLICIT if solicit is None else solicit
+        self.offer_socket = open_listener(Config.OFFER_UDP_PORT)
+        self.solicit_socket = None
+        if self.solicit:
+            self.solicit_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            enable_announcing(self.solicit_socket)
+            self.solicit_socket.bind(("", 0))
+
+    #the first (ip, udp_port, tcp_port) offered, soliciting every SOLICIT_INTERVAL;
+    #None once timeout seconds passed or keep_waiting() turned False
+    def wait(self, timeout=None, keep_waiting=lambda: True):
+        sockets = [self.offer_socket] + ([self.solicit_socket] if self.solicit_socket else [])
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # passive clients still wake up once a second to check keep_waiting
+        interval = Config.SOLICIT_INTERVAL if self.solicit_socket else 1.0
+        next_solicit = time.monotonic()
+        while keep_waiting():
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return None
+            if self.solicit_socket and now >= next_solicit:
+                self.solicit_socket.sendto(pack_solicit(), announce_address(Config.SOLICIT_UDP_PORT))
+                next_solicit = now + interval
+            wait = next_solicit - now if self.solicit_socket else interval
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            readable, _, _ = select.select(sockets, [], [], max(wait, 0))
+            for udp_socket in readable:
+                data, address = udp_socket.recvfrom(Config.CLIENT_BUFFER_SIZE)
+                ports = parse_offer(data)
+                if ports:
+                    return (address[0], *ports)
+        return None
+
+    def close(self):
+        self.offer_socket.close()
+        if self.solicit_socket:
+            self.solicit_socket.close()
+
+
+#time to first offer over rounds discoveries, soliciting or passively waiting for the periodic offer
+def benchmark(rounds=20, solicit=True):
+    waits = []
+    for _ in range(rounds):
+        # a fresh listener per round, like a client starting up, so no offer is left over
+        start = time.monotonic()
+        listener = OfferListener(solicit)
+        try:
+            server = listener.wait(timeout=3)
+        finally:
+            listener.close()
+        if server is None:
+            print(f"  {Colors.RED}✗ No offer within 3 s{Colors.ENDC}")
+            return
+        waits.append(time.monotonic() - start)
+    waits.sort()
+    mode = "solicited" if solicit else "passive"
+    print(f"  {Colors.BLUE}{mode}, {rounds} rounds: {Colors.CYAN}p50 {waits[len(waits) // 2] * 1000:.2f} ms, "
+          f"max {waits[-1] * 1000:.2f} ms{Colors.ENDC} from {server[0]}")
+
+
+if __name__ == '__main__':
+    print(f"{Colors.HEADER}{Colors.BOLD}Time to first offer (needs a running server){Colors.ENDC}")
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    benchmark(rounds, solicit=True)
+    benchmark(min(rounds, 5), solicit=False)
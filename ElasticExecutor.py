@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+from Config import Config
+
+
+class ElasticExecutor:
+    """
+    Thread pool that grows between min_workers and max_workers while tasks
+    wait in its bounded queue, and lets workers idle for longer than
+    idle_timeout exit again. Queue depth and wait times are kept so the
+    owner decides when to grow instead of polling on a timer.
+    """
+
+    def __init__(self, min_workers, max_workers, queue_size, idle_timeout):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.idle_timeout = idle_timeout
+        self.tasks = queue.Queue(maxsize=queue_size)
+        self.pressure = threading.Condition()
+        self.is_running = True
+
+        #metrics, guarded by pressure
+        self.workers = 0
+        self.idle = 0
+        self.completed = 0
+        self.rejected = 0
+        self.average_wait = 0.0
+        self.max_wait = 0.0
+
+        with self.pressure:
+            self.spawn(min_workers)
+
+    @property
+    def queue_depth(self):
+        return self.tasks.qsize()
+
+    #caller holds pressure
+    def spawn(self, count):
+        for _ in range(count):
+            self.workers += 1
+            threading.Thread(target=self.worker, daemon=True).start()
+
+    #raises queue.Full when the queue stays full for timeout seconds
+    def submit(self, fn, *args, timeout=None):
+        try:
+            self.tasks.put((fn, args, time.monotonic()), timeout=timeout)
+        except queue.Full:
+            with self.pressure:
+                self.rejected += 1
+            raise
+        with self.pressure:
+            if not self.idle:
+                self.pressure.notify_all()
+
+    #blocks until tasks are queued with no idle worker to take them, False on timeout
+    def wait_for_pressure(self, timeout):
+        with self.pressure:
+            return self.pressure.wait_for(
+                lambda: not self.is_running or (self.tasks.qsize() > self.idle and self.workers < self.max_workers),
+                timeout
+            ) and self.is_running
+
+    #seconds the task at the head of the queue has been waiting, 0 when nothing is queued.
+    #unlike average_wait this keeps growing while every worker is busy
+    def oldest_wait(self):
+        with self.tasks.mutex:
+            head = self.tasks.queue[0] if self.tasks.queue else None
+        return time.monotonic() - head[2] if head else 0.0
+
+    #adds workers for queued tasks once the oldest has waited POOL_WAIT_THRESHOLD or they
+    #outnumber the pool, returns how many
+    def scale_up(self):
+        with self.pressure:
+            backlog = self.tasks.qsize() - self.idle
+            if backlog <= 0:
+                return 0
+            if backlog < self.workers and self.oldest_wait() < Config.POOL_WAIT_THRESHOLD:
+                return 0
+            added = min(backlog, self.max_workers - self.workers)
+            self.spawn(added)
+            return added
+
+    def worker(self):
+        while self.is_running:
+            with self.pressure:
+                self.idle += 1
+            try:
+                task = self.tasks.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                task = None
+            finally:
+                with self.pressure:
+                    self.idle -= 1
+                    # a submit that still counted this worker as idle did not wake the owner
+                    if self.tasks.qsize() > self.idle:
+                        self.pressure.notify_all()
+
+            if task is None:
+                with self.pressure:
+                    # reap idle workers down to min_workers; sentinels end everyone on shutdown
+                    if not self.is_running or self.workers > self.min_workers:
+                        self.workers -= 1
+                        return
+                continue
+
+            fn, args, queued_at = task
+            waited = time.monotonic() - queued_at
+            with self.pressure:
+                self.average_wait += (waited - self.average_wait) * 0.1
+                self.max_wait = max(self.max_wait, waited)
+            try:
+                fn(*args)
+            except Exception:
+                pass  # handlers report their own errors
+            with self.pressure:
+                self.completed += 1
+        with self.pressure:
+            self.workers -= 1
+
+    def shutdown(self, wait=False):
+        with self.pressure:
+            self.is_running = False
+            workers = self.workers
+            self.pressure.notify_all()
+        for _ in range(workers):
+            try:
+                self.tasks.put_nowait(None)
+            except queue.Full:
+                break
+        if wait:
+            while self.workers:
+                time.sleep(0.05)
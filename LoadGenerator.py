@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import json
+import random
+import resource
+import socket
+import sys
+import time
+from collections import Counter, defaultdict
+from Config import Colors, Config, Format
+from Discovery import OfferListener
+from BenchmarkUtils import parse_size, percentile
+from PacketBitmap import PacketBitmap
+from Protocol import PAYLOAD_HEADER, pack_request, parse_payload_header
+
+# every key can come from the scenario file and be overridden on the command line
+DEFAULT_SCENARIO = {
+    'server': None,         # "ip:udp_port:tcp_port", discovered from offers when missing
+    'clients': 100,         # virtual clients at full ramp
+    'ramp_up': 10.0,        # seconds until every client has started
+    'duration': 60.0,       # seconds from start to the last new request, ramp-up included
+    'think_time': 1.0,      # mean pause after each request, exponentially distributed
+    'rate': 0.0,            # target requests per second over all clients, 0 for unlimited
+    'file_size': 1024 * 1024,
+    'udp_share': 0.0,       # fraction of requests made over UDP
+    'timeout': 10.0,        # per connect / quiet period before a request counts as failed
+}
+# soft descriptor limit asked for when the hard limit is unlimited; macOS rejects RLIM_INFINITY
+# (and anything above kern.maxfilesperproc), 10240 is its OPEN_MAX
+DESCRIPTOR_LIMIT_CAP = 10240
+
+
+class UdpTransferProtocol(asyncio.DatagramProtocol):
+    """Counts the segments of one UDP request as they arrive."""
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.packets = None
+        self.last_arrival = None
+        self.arrived = asyncio.Event()
+
+    def datagram_received(self, data, address):
+        header = parse_payload_header(data, len(data))
+        if header is None:
+            return
+        total_packets, packet_number = header
+        if self.packets is None:
+            self.packets = PacketBitmap(total_packets)
+        self.packets.add(packet_number)
+        self.last_arrival = time.monotonic()
+        self.generator.add_bytes(len(data) - PAYLOAD_HEADER.size)
+        self.arrived.set()
+
+
+class LoadGenerator:
+    """
+    Capacity test: thousands of virtual clients on one event loop, started
+    over a ramp-up period, each making requests with a think time in between
+    while a shared schedule holds the total to the target request rate.
+    Requests, errors and bytes are bucketed per second of the run.
+    """
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.server = None
+        self.start_time = 0.0
+        self.deadline = 0.0
+        self.next_slot = 0.0
+        self.active_clients = 0
+
+        #statistics: second -> [requests, errors, bytes]
+        self.series = defaultdict(lambda: [0, 0, 0])
+        self.latencies = []
+        self.udp_losses = []
+        self.error_kinds = Counter()
+
+    def second(self):
+        return int(time.monotonic() - self.start_time)
+
+    def add_bytes(self, size):
+        self.series[self.second()][2] += size
+
+    #every request takes the next slot of one shared schedule, so the total stays at the rate
+    async def wait_for_slot(self):
+        rate = self.scenario['rate']
+        if not rate:
+            return
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + 1 / rate
+        if slot > now:
+            # slots past the deadline will not be used, the caller checks it next
+            await asyncio.sleep(min(slot, self.deadline) - now)
+
+    async def tcp_request(self):
+        file_size = self.scenario['file_size']
+        start_time = time.monotonic()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.server[0], self.server[2]), self.scenario['timeout']
+        )
+        try:
+            writer.write(f"{file_size}\n".encode())
+            bytes_received = 0
+            while bytes_received < file_size:
+                data = await asyncio.wait_for(reader.read(Config.CLIENT_TCP_RECV_SIZE), self.scenario['timeout'])
+                if not data:
+                    raise ConnectionError("Server closed connection prematurely")
+                bytes_received += len(data)
+                self.add_bytes(len(data))
+            return time.monotonic() - start_time
+        finally:
+            writer.close()
+
+    async def udp_request(self):
+        loop = asyncio.get_running_loop()
+        start_time = time.monotonic()
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: UdpTransferProtocol(self), remote_addr=(self.server[0], self.server[1])
+        )
+        try:
+            transport.sendto(pack_request(self.scenario['file_size']))
+            # the first segment may take the full timeout, later gaps only a second
+            quiet = self.scenario['timeout']
+            while not (protocol.packets and protocol.packets.is_complete()):
+                protocol.arrived.clear()
+                try:
+                    await asyncio.wait_for(protocol.arrived.wait(), quiet)
+                except asyncio.TimeoutError:
+                    break
+                quiet = 1
+            if protocol.packets is None:
+                raise TimeoutError("no UDP payload received")
+            self.udp_losses.append(1 - len(protocol.packets) / protocol.packets.total_packets)
+            return protocol.last_arrival - start_time
+        finally:
+            transport.close()
+
+    async def virtual_client(self, index):
+        await asyncio.sleep(index * self.scenario['ramp_up'] / self.scenario['clients'])
+        self.active_clients += 1
+        try:
+            while time.monotonic() < self.deadline:
+                await self.wait_for_slot()
+                if time.monotonic() >= self.deadline:
+                    break
+                use_udp = random.random() < self.scenario['udp_share']
+                try:
+                    latency = await (self.udp_request() if use_udp else self.tcp_request())
+                    self.series[self.second()][0] += 1
+                    self.latencies.append(latency)
+                except (OSError, asyncio.TimeoutError, ConnectionError) as e:
+                    self.series[self.second()][1] += 1
+                    self.error_kinds[type(e).__name__] += 1
+                if self.scenario['think_time']:
+                    think_time = random.expovariate(1 / self.scenario['think_time'])
+                    await asyncio.sleep(min(think_time, max(0.0, self.deadline - time.monotonic())))
+        finally:
+            self.active_clients -= 1
+
+    #prints the second that just ended, once per second
+    async def report_seconds(self):
+        second = 0
+        while True:
+            await asyncio.sleep(self.start_time + second + 1 - time.monotonic())
+            requests, errors, bytes_received = self.series[second]
+            color = Colors.RED if errors else Colors.BLUE
+            print(f"{color}[{second + 1:4d}s] clients {Colors.CYAN}{self.active_clients:5d}{color}"
+                  f" | {Colors.CYAN}{requests:5d}{color} req/s"
+                  f" | {Colors.CYAN}{Format.format_speed(bytes_received * 8):>14}{color}"
+                  f" | errors {Colors.CYAN}{errors}{Colors.ENDC}")
+            second += 1
+
+    async def run(self):
+        self.start_time = time.monotonic()
+        self.deadline = self.start_time + self.scenario['duration']
+        reporter = asyncio.create_task(self.report_seconds())
+        await asyncio.gather(*(self.virtual_client(index) for index in range(self.scenario['clients'])))
+        reporter.cancel()
+        return time.monotonic() - self.start_time
+
+    def summary(self, elapsed):
+        requests = sum(bucket[0] for bucket in self.series.values())
+        errors = sum(bucket[1] for bucket in self.series.values())
+        total_bytes = sum(bucket[2] for bucket in self.series.values())
+        last_second = max(self.series, default=-1)
+        return {
+            'elapsed': elapsed,
+            'requests': requests,
+            'errors': errors,
+            'error_rate': errors / (requests + errors) if requests + errors else 0.0,
+            'bytes': total_bytes,
+            'throughput': total_bytes * 8 / elapsed if elapsed > 0 else 0.0,
+            'peak_throughput': max((bucket[2] * 8 for bucket in self.series.values()), default=0),
+            'request_rate': requests / elapsed if elapsed > 0 else 0.0,
+            'p50': percentile(self.latencies, 0.5),
+            'p99': percentile(self.latencies, 0.99),
+            'udp_loss': sum(self.udp_losses) / len(self.udp_losses) if self.udp_losses else 0.0,
+            'error_kinds': dict(self.error_kinds),
+            'series': [
+                dict(zip(('requests', 'errors', 'bytes'), self.series.get(second, [0, 0, 0])))
+                for second in range(last_second + 1)
+            ],
+        }
+
+    @staticmethod
+    def print_summary(summary):
+        print(f"{Colors.GREEN}{Colors.BOLD}Load test summary:{Colors.ENDC}\n"
+              f"  {Colors.BLUE}├─ Duration: {Colors.CYAN}{summary['elapsed']:.1f}s{Colors.ENDC}\n"
+              f"  {Colors.BLUE}├─ Requests: {Colors.CYAN}{summary['requests']}"
+              f" ({summary['request_rate']:.1f}/s){Colors.ENDC}\n"
+              f"  {Colors.BLUE}├─ Errors: {Colors.CYAN}{summary['errors']} ({summary['error_rate'] * 100:.2f}%)"
+              f"{' ' + str(summary['error_kinds']) if summary['error_kinds'] else ''}{Colors.ENDC}\n"
+              f"  {Colors.BLUE}├─ Data received: {Colors.CYAN}{Format.format_size(summary['bytes'])}{Colors.ENDC}\n"
+              f"  {Colors.BLUE}├─ Throughput avg/peak: {Colors.CYAN}{Format.format_speed(summary['throughput'])}"
+              f" / {Format.format_speed(summary['peak_throughput'])}{Colors.ENDC}\n"
+              f"  {Colors.BLUE}├─ Request time p50/p99: {Colors.CYAN}{summary['p50']:.3f}s / {summary['p99']:.3f}s{Colors.ENDC}\n"
+              f"  {Colors.BLUE}└─ UDP loss: {Colors.CYAN}{summary['udp_loss'] * 100:.2f}%{Colors.ENDC}")
+
+
+#waits for the first offer, soliciting one like the interactive client does
+def discover_server(timeout):
+    listener = OfferListener()
+    try:
+        server = listener.wait(timeout)
+    finally:
+        listener.close()
+    if server is None:
+        raise socket.timeout(f"no offer within {timeout}s")
+    return server
+
+
+#each virtual client holds a socket, so lift the soft descriptor limit as far as allowed
+def raise_descriptor_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = DESCRIPTOR_LIMIT_CAP if hard == resource.RLIM_INFINITY else hard
+    if soft == resource.RLIM_INFINITY or soft >= target:
+        return
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    except (ValueError, OSError) as e:
+        print(f"{Colors.YELLOW}Could not raise the descriptor limit above {soft}: {e}{Colors.ENDC}")
+
+
+def load_scenario(args):
+    scenario = dict(DEFAULT_SCENARIO)
+    if args.scenario:
+        with open(args.scenario) as scenario_file:
+            overrides = json.load(scenario_file)
+        unknown = set(overrides) - set(DEFAULT_SCENARIO)
+        if unknown:
+            raise ValueError(f"unknown scenario keys: {', '.join(sorted(unknown))}")
+        scenario.update(overrides)
+    for key in DEFAULT_SCENARIO:
+        value = getattr(args, key)
+        if value is not None:
+            scenario[key] = value
+    if isinstance(scenario['file_size'], str):
+        scenario['file_size'] = parse_size(scenario['file_size'])
+    if scenario['clients'] <= 0 or scenario['file_size'] <= 0 or not 0 <= scenario['udp_share'] <= 1:
+        raise ValueError("clients and file_size must be positive and udp_share between 0 and 1")
+    return scenario
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator with many concurrent virtual clients")
+    parser.add_argument('--scenario', help="JSON file with any of: " + ', '.join(DEFAULT_SCENARIO))
+    parser.add_argument('--server', help="ip:udp_port:tcp_port, otherwise wait for an offer")
+    parser.add_argument('--clients', type=int)
+    parser.add_argument('--ramp-up', dest='ramp_up', type=float)
+    parser.add_argument('--duration', type=float)
+    parser.add_argument('--think-time', dest='think_time', type=float)
+    parser.add_argument('--rate', type=float, help="target requests per second, 0 for unlimited")
+    parser.add_argument('--file-size', dest='file_size', type=parse_size, help="K/M/G suffixes allowed")
+    parser.add_argument('--udp-share', dest='udp_share', type=float)
+    parser.add_argument('--timeout', type=float)
+    parser.add_argument('--output', help="write the summary and per-second series as JSON")
+    args = parser.parse_args()
+    try:
+        scenario = load_scenario(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    raise_descriptor_limit()
+    generator = LoadGenerator(scenario)
+    if scenario['server']:
+        ip, udp_port, tcp_port = scenario['server'].rsplit(':', 2)
+        generator.server = (ip, int(udp_port), int(tcp_port))
+    else:
+        print(f"{Colors.BLUE}Waiting for a server offer...{Colors.ENDC}")
+        start_time = time.monotonic()
+        generator.server = discover_server(scenario['timeout'])
+        print(f"{Colors.BLUE}Time to offer: {Colors.CYAN}{(time.monotonic() - start_time) * 1000:.1f} ms{Colors.ENDC}")
+
+    print(f"{Colors.HEADER}{Colors.BOLD}Load test: {scenario['clients']} clients against "
+          f"{generator.server[0]} (UDP {generator.server[1]}, TCP {generator.server[2]}){Colors.ENDC}")
+    try:
+        elapsed = asyncio.run(generator.run())
+    except KeyboardInterrupt:
+        print(f"{Colors.YELLOW}Load test stopped manually{Colors.ENDC}")
+        elapsed = time.monotonic() - generator.start_time
+    summary = generator.summary(elapsed)
+    generator.print_summary(summary)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'scenario': scenario, 'summary': summary}, output, indent=2)
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from Config import Colors, Config
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+QUIET = 100  # above every level: nothing is queued
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR, 'quiet': QUIET}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+ANSI_CODES = re.compile(r'\033\[[0-9;]*m')
+# templates may use {BLUE}, {CYAN}, ... next to their own fields
+COLOR_FIELDS = {name: value for name, value in vars(Colors).items() if not name.startswith('_')}
+# without color templates get empty codes, which is far cheaper than stripping them afterwards
+PLAIN_FIELDS = dict.fromkeys(COLOR_FIELDS, '')
+
+
+#a level name or number as a number
+def parse_level(level):
+    return LEVELS[level.lower()] if isinstance(level, str) else level
+
+
+#json fallback for values that are not plain data: slotted objects become dicts, the rest strings
+def json_default(value):
+    slots = getattr(type(value), '__slots__', None)
+    if slots:
+        return {name: getattr(value, name) for name in slots}
+    return str(value)
+
+
+class Logger:
+    """
+    Structured logger that keeps formatting and I/O off the calling thread.
+    A call below the level returns after one comparison; otherwise it appends
+    a (time, level, message, fields) tuple to a bounded queue and a writer
+    thread renders and writes the batch. message is a str.format template
+    over the fields and the color names, or a callable taking the fields.
+    When the queue is full events are dropped and counted, never waited on.
+    """
+
+    def __init__(self, level=Config.LOG_LEVEL, output_format=Config.LOG_FORMAT,
+                 queue_size=Config.LOG_QUEUE_SIZE, stream=None, background=True):
+        self.level = parse_level(level)
+        self.output_format = output_format
+        self.queue_size = queue_size
+        # None writes to whatever sys.stdout is at write time
+        self.stream = stream
+        self.events = deque()
+        self.dropped = 0
+        self.reported_drops = 0
+        self.write_lock = threading.Lock()
+        self.wake = threading.Event()
+        # without the background writer events are only written by flush()
+        self.background = background
+        self.writer = None
+        self.writer_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def set_level(self, level):
+        self.level = parse_level(level)
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def debug(self, message, **fields):
+        if DEBUG >= self.level:
+            self.enqueue(DEBUG, message, fields)
+
+    def info(self, message, **fields):
+        if INFO >= self.level:
+            self.enqueue(INFO, message, fields)
+
+    def warning(self, message, **fields):
+        if WARNING >= self.level:
+            self.enqueue(WARNING, message, fields)
+
+    def error(self, message, **fields):
+        if ERROR >= self.level:
+            self.enqueue(ERROR, message, fields)
+            self.wake.set()
+
+    def enqueue(self, level, message, fields):
+        if len(self.events) >= self.queue_size:
+            self.dropped += 1
+            return
+        self.events.append((time.time(), level, message, fields))
+        if self.writer is None and self.background:
+            self.start_writer()
+
+    def start_writer(self):
+        with self.writer_lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.write_loop, name='log-writer', daemon=True)
+                self.writer.start()
+
+    def write_loop(self):
+        while True:
+            self.wake.wait(Config.LOG_FLUSH_INTERVAL)
+            self.wake.clear()
+            self.flush()
+
+    #writes everything queued so far; callers use it before printing directly to keep the order
+    def flush(self):
+        with self.write_lock:
+            if not self.events and self.dropped == self.reported_drops:
+                return
+            stream = self.stream or sys.stdout
+            color = self.use_color(stream)
+            lines = []
+            while self.events:
+                lines.append(self.render(*self.events.popleft(), color))
+            if self.dropped != self.reported_drops:
+                lines.append(self.render(time.time(), WARNING, "{YELLOW}Log queue full, {count} events dropped{ENDC}",
+                                         {'count': self.dropped - self.reported_drops}, color))
+                self.reported_drops = self.dropped
+            try:
+                stream.write('\n'.join(lines) + '\n')
+                stream.flush()
+            except (OSError, ValueError):
+                # the stream is gone (closed at exit, redirected and closed), the events with it
+                pass
+
+    def render(self, timestamp, level, message, fields, color):
+        try:
+            if callable(message):
+                text = message(**fields)
+            else:
+                text = message.format(**(COLOR_FIELDS if color else PLAIN_FIELDS), **fields)
+        except Exception as e:
+            text = f"{message!r} could not be rendered: {e}"
+        if not color and '\033' in text:
+            # callables and field values may carry their own codes
+            text = ANSI_CODES.sub('', text)
+        if self.output_format == 'json':
+            return json.dumps({'time': timestamp, 'level': LEVEL_NAMES.get(level, level), 'message': text.strip(),
+                               **fields}, default=json_default)
+        return text
+
+    def use_color(self, stream):
+        if self.output_format == 'json':
+            return False
+        if Config.LOG_COLOR is not None:
+            return Config.LOG_COLOR
+        isatty = getattr(stream, 'isatty', None)
+        return bool(isatty and isatty())
+
+
+log = Logger()
+
+
+#per-event cost on the calling thread, quiet against queued against a plain print;
+#the writer is kept out of the loop so its rendering is timed separately
+def benchmark(events=100000):
+    address = ('127.0.0.1', 50000)
+    template = "{GREEN}✓ TCP transfer complete to {CYAN}{address}{ENDC} ({size} bytes)"
+    with open(os.devnull, 'w') as devnull:
+        cases = [
+            ("quiet", Logger(QUIET, 'plain', events, devnull, background=False)),
+            ("plain", Logger(INFO, 'plain', events, devnull, background=False)),
+            ("json", Logger(INFO, 'json', events, devnull, background=False)),
+        ]
+        for name, logger in cases:
+            start = time.perf_counter()
+            for i in range(events):
+                logger.info(template, address=address, size=i)
+            cost = (time.perf_counter() - start) / events
+            write_start = time.perf_counter()
+            logger.flush()
+            write_cost = (time.perf_counter() - write_start) / events
+            print(f"  {Colors.BLUE}{name}: {Colors.CYAN}{cost * 1e9:.0f} ns{Colors.BLUE} per call, "
+                  f"{Colors.CYAN}{write_cost * 1e9:.0f} ns{Colors.BLUE} in the writer{Colors.ENDC}")
+
+        start = time.perf_counter()
+        for i in range(events):
+            print(f"{Colors.GREEN}✓ TCP transfer complete to {Colors.CYAN}{address}{Colors.ENDC} ({i} bytes)",
+                  file=devnull)
+        cost = (time.perf_counter() - start) / events
+        print(f"  {Colors.BLUE}print: {Colors.CYAN}{cost * 1e9:.0f} ns{Colors.BLUE} per call{Colors.ENDC}")
+
+
+if __name__ == '__main__':
+    print(f"{Colors.HEADER}{Colors.BOLD}Logging cost per event{Colors.ENDC}")
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,58 @@
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+class MemoryBudget:
+    """
+    Thread-safe byte budget: callers reserve before buffering data and release when done.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def try_reserve(self, size):
+        with self.lock:
+            if self.in_use + size > self.limit:
+                return False
+            self.in_use += size
+            self.peak = max(self.peak, self.in_use)
+            return True
+
+    def release(self, size):
+        with self.lock:
+            self.in_use -= size
+
+
+#peak resident set size of this process in bytes, None where unsupported;
+#since the last reset_peak_rss() where linux allows it, else over the process lifetime
+def peak_rss():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+#restarts the peak_rss() high-water mark at the current size, False where the platform cannot
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
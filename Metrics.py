@@ -0,0 +1,332 @@
+import math
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Config import Colors, Config
+
+HISTOGRAM_NAMES = ('first_byte', 'send_block', 'duration')
+HISTOGRAM_STATS = {'p50': 0.5, 'p99': 0.99, 'max': 1.0}
+TRANSFER_FIELDS = [f"{protocol}_{name}_{stat}" for protocol in ('tcp', 'udp')
+                   for name in HISTOGRAM_NAMES for stat in HISTOGRAM_STATS] + ['tcp_throughput', 'udp_throughput']
+
+# prometheus name, type, help, then (labels, statistics field) per sample
+PROMETHEUS_METRICS = [
+    ('speedtest_sent_bytes_total', 'counter', 'Payload bytes sent',
+     [('protocol="tcp"', 'tcp_bytes'), ('protocol="udp"', 'udp_bytes')]),
+    ('speedtest_connections_total', 'counter', 'TCP connections accepted and UDP requests admitted',
+     [('protocol="tcp"', 'tcp_connections'), ('protocol="udp"', 'udp_connections')]),
+    ('speedtest_tcp_requests_total', 'counter', 'TCP transfer requests served', [('', 'tcp_requests')]),
+    ('speedtest_transfer_errors_total', 'counter', 'Failed or dropped transfers', [('', 'transfer_errors')]),
+    ('speedtest_active_clients', 'gauge', 'Clients with an open connection', [('', 'active_clients')]),
+    ('speedtest_active_connections', 'gauge', 'Open connections',
+     [('protocol="tcp"', 'active_tcp'), ('protocol="udp"', 'active_udp')]),
+    ('speedtest_active_tcp_requests', 'gauge', 'TCP requests being sent right now', [('', 'active_tcp_requests')]),
+    ('speedtest_udp_sessions', 'gauge', 'UDP sessions by state',
+     [('state="live"', 'live_udp_sessions'), ('state="waiting"', 'waiting_udp_sessions')]),
+    ('speedtest_udp_memory_bytes', 'gauge', 'Memory for buffered UDP segments',
+     [('kind="in_use"', 'udp_memory_in_use'), ('kind="limit"', 'udp_memory_limit'), ('kind="peak"', 'udp_memory_peak')]),
+    ('speedtest_pool_workers', 'gauge', 'TCP worker threads',
+     [('state="all"', 'pool_workers'), ('state="idle"', 'pool_idle')]),
+    ('speedtest_pool_queue_depth', 'gauge', 'TCP connections waiting for a worker', [('', 'pool_queue')]),
+    ('speedtest_pool_wait_seconds', 'gauge', 'Time connections waited for a worker',
+     [('stat="average"', 'pool_average_wait'), ('stat="max"', 'pool_max_wait')]),
+    ('speedtest_pool_rejected_total', 'counter', 'Connections dropped on a full worker queue', [('', 'pool_rejected')]),
+    ('speedtest_peak_rss_bytes', 'gauge', 'Peak resident memory of the server process(es)', [('', 'peak_rss')]),
+    ('speedtest_sent_bytes_last_second', 'gauge', 'Payload bytes sent during the last complete second',
+     [('protocol="tcp"', 'tcp_throughput'), ('protocol="udp"', 'udp_throughput')]),
+] + [
+    (f'speedtest_{name}_seconds', 'gauge', description,
+     [(f'protocol="{protocol}",quantile="{quantile}"', f"{protocol}_{field}_{stat}")
+      for protocol in ('tcp', 'udp') for stat, quantile in (('p50', '0.5'), ('p99', '0.99'), ('max', '1'))])
+    for name, field, description in [
+        ('time_to_first_byte', 'first_byte', 'Time from a request to its first sent byte'),
+        ('send_block', 'send_block', 'Time a single send call blocked'),
+        ('transfer_duration', 'duration', 'Time from a request to its last sent byte'),
+    ]
+]
+
+
+class ThreadShards:
+    """
+    Statistics every thread records into a shard of its own, so concurrent
+    recording never loses an update and never takes a lock after a thread's
+    first record. Reading merges the shards; shards of threads that exited
+    are folded into one so pool churn does not grow the list. Subclasses
+    say how a shard is created and merged into another.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = {}  # thread -> shard, only that thread writes it
+        self.retired = self.new_shard()
+        self.lock = threading.Lock()
+
+    def new_shard(self):
+        raise NotImplementedError
+
+    @staticmethod
+    def merge(target, shard):
+        raise NotImplementedError
+
+    #this thread's shard, created on its first record
+    def shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = self.new_shard()
+            with self.lock:
+                self.fold_retired()
+                self.shards[threading.current_thread()] = shard
+            return shard
+
+    #caller holds lock
+    def fold_retired(self):
+        for thread in [thread for thread in self.shards if not thread.is_alive()]:
+            self.merge(self.retired, self.shards.pop(thread))
+
+    def merged(self):
+        total = self.new_shard()
+        with self.lock:
+            self.fold_retired()
+            self.merge(total, self.retired)
+            for shard in self.shards.values():
+                self.merge(total, shard)
+        return total
+
+
+class ShardedCounter(ThreadShards):
+    """Counter summed over per-thread shards."""
+
+    def new_shard(self):
+        return [0]
+
+    @staticmethod
+    def merge(target, shard):
+        target[0] += shard[0]
+
+    def add(self, amount=1):
+        try:
+            self.local.shard[0] += amount
+        except AttributeError:
+            self.shard()[0] += amount
+
+    @property
+    def value(self):
+        return self.merged()[0]
+
+
+class ShardedGauge(ShardedCounter):
+    """A sharded counter that also goes down; a thread may release what another one added."""
+
+    def sub(self, amount=1):
+        self.add(-amount)
+
+
+class Histogram:
+    """
+    HDR-style histogram of non-negative integers (nanoseconds here) in fixed
+    memory: values below 2**significant_bits are counted exactly, larger
+    ones in log-linear buckets whose width keeps the relative error under
+    2**-(significant_bits - 1). Values above 2**max_bits - 1 are clamped.
+    Not thread-safe, see ShardedHistogram.
+    """
+
+    def __init__(self, significant_bits=Config.HISTOGRAM_SIGNIFICANT_BITS, max_bits=Config.HISTOGRAM_MAX_BITS):
+        self.significant_bits = significant_bits
+        self.sub_buckets = 1 << significant_bits
+        self.half = self.sub_buckets >> 1
+        self.highest = (1 << max_bits) - 1
+        self.counts = array('Q', bytes(8 * self.bucket_index(self.highest) + 8))
+        self.total = 0
+        self.max = 0
+
+    def bucket_index(self, value):
+        if value < self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.significant_bits
+        return self.sub_buckets + (shift - 1) * self.half + (value >> shift) - self.half
+
+    #the largest value that lands in bucket index
+    def bucket_limit(self, index):
+        if index < self.sub_buckets:
+            return index
+        shift, mantissa = divmod(index - self.sub_buckets, self.half)
+        shift += 1
+        return ((mantissa + self.half) << shift) + (1 << shift) - 1
+
+    def record(self, value):
+        value = min(max(value, 0), self.highest)
+        self.counts[self.bucket_index(value)] += 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def add(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    #upper bound of the value below which fraction of the records fall, fraction in [0, 1]
+    def percentile(self, fraction):
+        if not self.total:
+            return 0
+        rank = max(1, math.ceil(fraction * self.total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bucket_limit(index), self.max)
+        return self.max
+
+
+class ShardedHistogram(ThreadShards):
+    """Histogram recorded per thread and merged on read."""
+
+    def new_shard(self):
+        return Histogram()
+
+    @staticmethod
+    def merge(target, shard):
+        target.add(shard)
+
+    def record(self, value):
+        try:
+            self.local.shard.record(value)
+        except AttributeError:
+            self.shard().record(value)
+
+
+class ThroughputSeries:
+    """Bytes per monotonic second over a ring of the last Config.THROUGHPUT_SERIES_SECONDS seconds."""
+
+    def __init__(self, seconds=Config.THROUGHPUT_SERIES_SECONDS):
+        self.seconds = array('q', [-1]) * seconds
+        self.totals = array('Q', bytes(8 * seconds))
+
+    def add(self, size, now_ns):
+        second = now_ns // 1_000_000_000
+        slot = second % len(self.seconds)
+        if self.seconds[slot] != second:
+            self.seconds[slot] = second
+            self.totals[slot] = 0
+        self.totals[slot] += size
+
+    def merge(self, other):
+        for slot, second in enumerate(other.seconds):
+            if second > self.seconds[slot]:
+                self.seconds[slot] = second
+                self.totals[slot] = other.totals[slot]
+            elif second == self.seconds[slot] >= 0:
+                self.totals[slot] += other.totals[slot]
+
+    #bytes sent in each of the last count complete seconds, oldest first
+    def last(self, count, now_ns):
+        current = now_ns // 1_000_000_000
+        series = []
+        for second in range(current - count, current):
+            slot = second % len(self.seconds)
+            series.append(self.totals[slot] if self.seconds[slot] == second else 0)
+        return series
+
+
+class ShardedThroughput(ThreadShards):
+    """ThroughputSeries recorded per thread and merged on read."""
+
+    def new_shard(self):
+        return ThroughputSeries()
+
+    @staticmethod
+    def merge(target, shard):
+        target.merge(shard)
+
+    def add(self, size, now_ns):
+        try:
+            self.local.shard.add(size, now_ns)
+        except AttributeError:
+            self.shard().add(size, now_ns)
+
+
+class TransferMetrics:
+    """
+    Timing of one protocol's transfers on the monotonic nanosecond clock:
+    time to first byte from request to first send, how long each send
+    blocked, whole transfer duration, and bytes sent per second. Long send
+    blocks point at a client (or network) applying backpressure; a slow
+    first byte or slow transfers with short blocks point at the server.
+    """
+
+    def __init__(self):
+        self.first_byte = ShardedHistogram()
+        self.send_block = ShardedHistogram()
+        self.duration = ShardedHistogram()
+        self.throughput = ShardedThroughput()
+
+    #one send of size bytes that started and returned at these monotonic_ns times
+    def record_send(self, size, started_ns, finished_ns):
+        self.send_block.record(finished_ns - started_ns)
+        self.throughput.add(size, finished_ns)
+
+    #flat fields for statistics(): percentiles in seconds, bytes sent in the last complete second
+    def statistics(self, protocol):
+        stats = {}
+        for name in HISTOGRAM_NAMES:
+            histogram = getattr(self, name).merged()
+            for stat, fraction in HISTOGRAM_STATS.items():
+                stats[f"{protocol}_{name}_{stat}"] = histogram.percentile(fraction) / 1e9
+        stats[f"{protocol}_throughput"] = self.throughput_series(1)[0]
+        return stats
+
+    def throughput_series(self, seconds):
+        return self.throughput.merged().last(seconds, time.monotonic_ns())
+
+
+#the statistics dict in the prometheus text exposition format
+def render_prometheus(stats):
+    lines = []
+    for name, kind, description, samples in PROMETHEUS_METRICS:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, field in samples:
+            lines.append(f"{name}{{{labels}}} {stats[field]}" if labels else f"{name} {stats[field]}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsEndpoint:
+    """
+    Serves render_prometheus(collect()) on GET /metrics from a daemon thread.
+    Bind it to localhost: it is meant for a scraper on the same host.
+    """
+
+    def __init__(self, collect, host, port):
+        collect_statistics = collect
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = render_prometheus(collect_statistics()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                return  # scrapes are too frequent to print
+
+        self.http_server = ThreadingHTTPServer((host, port), Handler)
+        self.http_server.daemon_threads = True
+        self.port = self.http_server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        print(f"{Colors.BLUE}Metrics endpoint: {Colors.CYAN}http://{self.http_server.server_address[0]}:"
+              f"{self.port}/metrics{Colors.ENDC}")
+
+    def stop(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
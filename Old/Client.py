@@ -1,11 +1,11 @@
 import socket
-import struct
 import threading
 import time
 import sys
 from queue import Queue
 import signal
 from Config import Colors,Config,Format
+from Protocol import PAYLOAD_HEADER, pack_request, parse_offer, parse_payload_header
 
 
 
@@ -110,7 +110,7 @@ class SpeedTestClient:
             udp_socket.settimeout(1)
 
             print(f"{Colors.BLUE}Starting UDP transfer #{connection_id}...{Colors.ENDC}")
-            request = struct.pack(">IBQ", Config.MAGIC_COOKIE, 0x3, self.file_size)
+            request = pack_request(self.file_size)
             udp_socket.sendto(request, (server_ip, udp_port))
             received_packets = set()
             total_packets = None
@@ -120,16 +120,12 @@ class SpeedTestClient:
             while self.is_running:
                 try:
                     data, _ = udp_socket.recvfrom(Config.CLIENT_BUFFER_SIZE)
-                    if len(data) < struct.calcsize(">IBQQ"):
+                    header = parse_payload_header(data, len(data))
+                    if header is None:
                         continue
 
-                    header = data[:struct.calcsize(">IBQQ")]
-                    payload = data[struct.calcsize(">IBQQ"):]
-                    magic_cookie, message_type, total_packets, packet_number = struct.unpack(
-                        ">IBQQ", header
-                    )
-                    if magic_cookie != Config.MAGIC_COOKIE or message_type != 0x4:
-                        continue
+                    total_packets, packet_number = header
+                    payload = data[PAYLOAD_HEADER.size:]
 
                     received_packets.add(packet_number)
                     bytes_received += len(payload)
@@ -211,9 +207,10 @@ class SpeedTestClient:
         while not self.transfers_completed and self.is_running:
             try:
                 data, address = udp_socket.recvfrom(Config.CLIENT_BUFFER_SIZE)
-                magic_cookie, message_type, udp_port, tcp_port = struct.unpack('>IBHH', data)
+                ports = parse_offer(data)
 
-                if magic_cookie == Config.MAGIC_COOKIE and message_type == Config.OFFER_TYPE:
+                if ports:
+                    udp_port, tcp_port = ports
                     print(
                         f"\n{Colors.GREEN}➜ Found server:{Colors.ENDC}\n"
                         f"  {Colors.BLUE}├─ IP: {Colors.CYAN}{address[0]}{Colors.ENDC}\n"
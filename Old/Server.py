@@ -1,12 +1,12 @@
 import socket
 import time
-import struct
 import threading
 import sys
 from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Manager
 from Config import Colors
 import Config
+from Protocol import PAYLOAD_HEADER, pack_offer, pack_payload_header, parse_request
 
 
 class SpeedTestServer:
@@ -78,11 +78,7 @@ class SpeedTestServer:
 
         while self.is_running:
             try:
-                message = struct.pack('>IBHH',
-                                      Config.MAGIC_COOKIE,
-                                      Config.OFFER_TYPE,
-                                      self.SERVER_UDP_PORT,
-                                      self.SERVER_TCP_PORT)
+                message = pack_offer(self.SERVER_UDP_PORT, self.SERVER_TCP_PORT)
                 udp_broadcast.sendto(message, ('<broadcast>', Config.UDP_PORT))
                 time.sleep(1)
             except Exception as e:
@@ -140,23 +136,20 @@ class SpeedTestServer:
 
     def handle_udp_requests(self):
         MAX_PAYLOAD_SIZE = 1400
-        HEADER_SIZE = struct.calcsize(">IBQQ")
+        HEADER_SIZE = PAYLOAD_HEADER.size
 
         while self.is_running:
             try:
                 self.udp_socket.settimeout(1.0)
                 data, address = self.udp_socket.recvfrom(Config.SERVER_BUFFER_SIZE)
 
-                if len(data) < struct.calcsize(">IBQ"):
+                file_size = parse_request(data)
+                if file_size is None:
                     continue
 
                 self.track_client(address[0], 'udp')
 
                 try:
-                    magic_cookie, message_type, file_size = struct.unpack(">IBQ", data)
-                    if magic_cookie != Config.MAGIC_COOKIE or message_type != 0x3:
-                        continue
-
                     print(f"{Colors.GREEN}➜ New UDP request from {Colors.CYAN}{address}{Colors.ENDC}")
                     print(f"{Colors.BLUE}Requested size: {Colors.CYAN}{Config.format_size(file_size)}{Colors.ENDC}")
 
@@ -171,13 +164,7 @@ class SpeedTestServer:
                         remaining = file_size - bytes_sent
                         payload_size = min(remaining, MAX_PAYLOAD_SIZE)
 
-                        header = struct.pack(
-                            ">IBQQ",
-                            Config.MAGIC_COOKIE,
-                            0x4,
-                            total_packets,
-                            packet_number
-                        )
+                        header = pack_payload_header(total_packets, packet_number)
                         payload = b'A' * payload_size
 
                         self.udp_socket.sendto(header + payload, address)
@@ -0,0 +1,71 @@
+import threading
+import time
+from Config import Config
+
+
+class TokenBucket:
+    """
+    Byte-rate limiter. Senders check wait_time() before a burst and consume()
+    what they actually sent; the balance may go negative, which simply delays
+    the next burst. A rate of 0 disables pacing.
+    """
+
+    def __init__(self, rate, burst=Config.UDP_PACING_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        if not self.rate:
+            return 0
+        with self.lock:
+            self.refill(time.monotonic())
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def consume(self, size):
+        if not self.rate:
+            return
+        with self.lock:
+            self.refill(time.monotonic())
+            self.tokens -= size
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.refill(time.monotonic())
+            self.rate = rate
+
+
+class AimdController:
+    """
+    Adjusts a session's TokenBucket from client feedback: additive increase
+    while the loss in the last feedback window stays under the threshold,
+    multiplicative decrease when it does not.
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.last_highest = 0
+        self.last_received = 0
+        self.decreases = 0
+
+    def on_feedback(self, highest, received):
+        expected = highest - self.last_highest
+        arrived = received - self.last_received
+        self.last_highest = max(self.last_highest, highest)
+        self.last_received = received
+        if expected <= 0:
+            return
+
+        loss = max(0.0, 1 - arrived / expected)
+        if loss > Config.UDP_AIMD_LOSS_THRESHOLD:
+            rate = max(Config.UDP_AIMD_MIN_RATE, self.bucket.rate * Config.UDP_AIMD_DECREASE)
+            self.decreases += 1
+        else:
+            rate = min(Config.UDP_AIMD_MAX_RATE, self.bucket.rate + Config.UDP_AIMD_INCREASE)
+        self.bucket.set_rate(rate)
@@ -0,0 +1,64 @@
+import re
+
+# runs of bytes that still have at least one clear bit
+INCOMPLETE_BYTES = re.compile(rb'[^\xff]+')
+
+
+class PacketBitmap:
+    """
+    Arrival tracker for one UDP transfer: one bit per segment, so a million
+    segments cost 125 KB instead of a set of ints. Packet numbers are one based.
+    """
+
+    def __init__(self, total_packets):
+        self.total_packets = total_packets
+        self.bits = bytearray((total_packets + 7) // 8)
+        self.count = 0
+        self.highest = 0
+
+    def __len__(self):
+        return self.count
+
+    #marks packet_number as received, False for duplicates and out-of-range numbers
+    def add(self, packet_number):
+        index = packet_number - 1
+        if not 0 <= index < self.total_packets:
+            return False
+        mask = 1 << (index & 7)
+        if self.bits[index >> 3] & mask:
+            return False
+        self.bits[index >> 3] |= mask
+        self.count += 1
+        if packet_number > self.highest:
+            self.highest = packet_number
+        return True
+
+    def is_complete(self):
+        return self.count == self.total_packets
+
+    #(first missing packet, count) runs, at most limit of them
+    def missing_ranges(self, limit):
+        ranges = []
+        first_missing = None
+        last_index = 0
+        for run in INCOMPLETE_BYTES.finditer(self.bits):
+            start = run.start() * 8
+            end = min(run.end() * 8, self.total_packets)
+            if first_missing is not None and start != last_index:
+                ranges.append((first_missing + 1, last_index - first_missing))
+                first_missing = None
+                if len(ranges) == limit:
+                    return ranges
+            for index in range(start, end):
+                if self.bits[index >> 3] & (1 << (index & 7)):
+                    if first_missing is not None:
+                        ranges.append((first_missing + 1, index - first_missing))
+                        first_missing = None
+                        if len(ranges) == limit:
+                            return ranges
+                elif first_missing is None:
+                    first_missing = index
+            last_index = end
+        if first_missing is not None:
+            ranges.append((first_missing + 1, last_index - first_missing))
+        return ranges
@@ -0,0 +1,141 @@
+import struct
+import sys
+import timeit
+from Config import Colors, Config
+
+# every message is compiled once here; the hot paths only call pack_into and unpack_from
+OFFER = struct.Struct(Config.OFFER_STRUCT_FORMAT)
+REQUEST = struct.Struct(Config.REQUEST_STRUCT_FORMAT)
+PAYLOAD_HEADER = struct.Struct(Config.PAYLOAD_STRUCT_FORMAT)
+NACK_HEADER = struct.Struct(Config.NACK_STRUCT_FORMAT)
+NACK_RANGE = struct.Struct(Config.NACK_RANGE_FORMAT)
+TCP_REQUEST = struct.Struct(Config.TCP_REQUEST_STRUCT_FORMAT)
+SOLICIT = struct.Struct(Config.SOLICIT_STRUCT_FORMAT)
+
+# the cookie and the type lead every message
+MESSAGE_PREFIX = struct.Struct("!IB")
+
+
+#the type byte of a message, None when data is too short or not ours
+def message_type(data):
+    if len(data) < MESSAGE_PREFIX.size:
+        return None
+    magic_cookie, kind = MESSAGE_PREFIX.unpack_from(data)
+    return kind if magic_cookie == Config.MAGIC_COOKIE else None
+
+
+def pack_offer(udp_port, tcp_port):
+    return OFFER.pack(Config.MAGIC_COOKIE, Config.OFFER_TYPE, udp_port, tcp_port)
+
+
+#(udp_port, tcp_port) of an offer, None when data is not one
+def parse_offer(data):
+    if len(data) != OFFER.size:
+        return None
+    magic_cookie, kind, udp_port, tcp_port = OFFER.unpack(data)
+    if magic_cookie != Config.MAGIC_COOKIE or kind != Config.OFFER_TYPE:
+        return None
+    return udp_port, tcp_port
+
+
+def pack_solicit():
+    return SOLICIT.pack(Config.MAGIC_COOKIE, Config.SOLICIT_TYPE)
+
+
+def is_solicit(data):
+    return len(data) == SOLICIT.size and message_type(data) == Config.SOLICIT_TYPE
+
+
+def pack_request(file_size):
+    return REQUEST.pack(Config.MAGIC_COOKIE, Config.REQUEST_TYPE, file_size)
+
+
+#the file size a udp request asks for, None when data is not one
+def parse_request(data):
+    if len(data) != REQUEST.size:
+        return None
+    magic_cookie, kind, file_size = REQUEST.unpack(data)
+    if magic_cookie != Config.MAGIC_COOKIE or kind != Config.REQUEST_TYPE:
+        return None
+    return file_size
+
+
+def pack_payload_header(total_packets, packet_number):
+    return PAYLOAD_HEADER.pack(Config.MAGIC_COOKIE, Config.PAYLOAD_TYPE, total_packets, packet_number)
+
+
+#writes a payload header at offset of buffer; packet_number is sent as given
+def pack_payload_header_into(buffer, offset, total_packets, packet_number):
+    PAYLOAD_HEADER.pack_into(buffer, offset, Config.MAGIC_COOKIE, Config.PAYLOAD_TYPE, total_packets, packet_number)
+
+
+#(total_packets, packet_number) of a payload datagram of size bytes in buffer, None when it is not one
+def parse_payload_header(buffer, size):
+    if size < PAYLOAD_HEADER.size:
+        return None
+    magic_cookie, kind, total_packets, packet_number = PAYLOAD_HEADER.unpack_from(buffer)
+    if magic_cookie != Config.MAGIC_COOKIE or kind != Config.PAYLOAD_TYPE:
+        return None
+    return total_packets, packet_number
+
+
+#client feedback: (highest segment seen, segments received, [(first missing, count), ...]) or None
+def parse_nack(data):
+    if len(data) < NACK_HEADER.size:
+        return None
+    magic_cookie, kind, highest, received, range_count = NACK_HEADER.unpack_from(data)
+    if magic_cookie != Config.MAGIC_COOKIE or kind != Config.NACK_TYPE:
+        return None
+    if len(data) < NACK_HEADER.size + range_count * NACK_RANGE.size:
+        return None
+    ranges = [NACK_RANGE.unpack_from(data, NACK_HEADER.size + i * NACK_RANGE.size) for i in range(range_count)]
+    return highest, received, ranges
+
+
+def build_nack(highest, received, ranges):
+    message = bytearray(NACK_HEADER.size + len(ranges) * NACK_RANGE.size)
+    NACK_HEADER.pack_into(message, 0, Config.MAGIC_COOKIE, Config.NACK_TYPE, highest, received, len(ranges))
+    for index, (first, count) in enumerate(ranges):
+        NACK_RANGE.pack_into(message, NACK_HEADER.size + index * NACK_RANGE.size, first, count)
+    return bytes(message)
+
+
+#the pre-Protocol way of parsing an offer, kept as the benchmark's reference
+def parse_offer_with_format(data):
+    if len(data) != struct.calcsize(Config.OFFER_STRUCT_FORMAT):
+        return None
+    magic_cookie, kind, udp_port, tcp_port = struct.unpack(Config.OFFER_STRUCT_FORMAT, data)
+    if magic_cookie != Config.MAGIC_COOKIE or kind != Config.OFFER_TYPE:
+        return None
+    return udp_port, tcp_port
+
+
+#per-call cost of the codecs against formatting the raw Config strings on every call
+def benchmark(iterations=200000):
+    buffer = bytearray(Config.CLIENT_BUFFER_SIZE)
+    pack_payload_header_into(buffer, 0, 1000, 1)
+    datagram = memoryview(buffer)
+    offer = pack_offer(1, 2)
+    cases = [
+        ("offer pack, format string",
+         lambda: struct.pack(Config.OFFER_STRUCT_FORMAT, Config.MAGIC_COOKIE, Config.OFFER_TYPE, 1, 2)),
+        ("offer pack, precompiled", lambda: pack_offer(1, 2)),
+        ("offer parse, format string", lambda: parse_offer_with_format(offer)),
+        ("offer parse, precompiled", lambda: parse_offer(offer)),
+        ("payload header, pack + copy into buffer",
+         lambda: buffer.__setitem__(slice(0, PAYLOAD_HEADER.size),
+                                    struct.pack(Config.PAYLOAD_STRUCT_FORMAT, Config.MAGIC_COOKIE,
+                                                Config.PAYLOAD_TYPE, 1000, 1))),
+        ("payload header, pack_into", lambda: pack_payload_header_into(buffer, 0, 1000, 1)),
+        ("payload header parse, slice + unpack",
+         lambda: struct.unpack(Config.PAYLOAD_STRUCT_FORMAT, datagram[:struct.calcsize(Config.PAYLOAD_STRUCT_FORMAT)])),
+        ("payload header parse, unpack_from", lambda: PAYLOAD_HEADER.unpack_from(datagram)),
+    ]
+    for name, case in cases:
+        cost = timeit.timeit(case, number=iterations) / iterations
+        print(f"  {Colors.BLUE}{name}: {Colors.CYAN}{cost * 1e9:.0f} ns{Colors.ENDC}")
+
+
+if __name__ == '__main__':
+    print(f"{Colors.HEADER}{Colors.BOLD}Protocol codec microbenchmarks{Colors.ENDC}")
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
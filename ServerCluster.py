@@ -0,0 +1,170 @@
+import argparse
+import multiprocessing
+import socket
+import time
+from Config import Colors, Config
+from ServerNew import Server, POOL_FIELDS
+from AsyncServer import AsyncServer
+from Metrics import TRANSFER_FIELDS
+
+STAT_FIELDS = [
+    'tcp_bytes', 'udp_bytes', 'tcp_connections', 'tcp_requests', 'udp_connections',
+    'active_clients', 'active_tcp', 'active_udp', 'active_tcp_requests', 'live_udp_sessions', 'waiting_udp_sessions',
+    'udp_memory_in_use', 'udp_memory_limit', 'udp_memory_peak', 'peak_rss',
+] + POOL_FIELDS + ['transfer_errors'] + TRANSFER_FIELDS
+# everything else is summed across workers; percentiles cannot be merged, the slowest worker's are shown
+STAT_MERGE = {'pool_max_wait': max, **{field: max for field in TRANSFER_FIELDS if not field.endswith('_throughput')}}
+
+
+class ClusterWorkerMixin:
+    """
+    A Server living in a worker process: the parent handles discovery and
+    serves metrics, and statistics are published into the worker's slot of
+    a shared array.
+    """
+
+    def start_discovery(self):
+        return
+
+    def start_metrics_endpoint(self):
+        return None
+
+    def periodic_statistics(self):
+        while self.is_running:
+            self.publish_statistics()
+            time.sleep(Config.CLUSTER_STATS_INTERVAL)
+
+    def publish_statistics(self):
+        stats = self.statistics()
+        base = self.worker_index * len(STAT_FIELDS)
+        for offset, field in enumerate(STAT_FIELDS):
+            self.shared_stats[base + offset] = stats[field]
+
+
+class ThreadWorker(ClusterWorkerMixin, Server):
+    pass
+
+
+class AsyncWorker(ClusterWorkerMixin, AsyncServer):
+    pass
+
+
+def run_worker(worker_class, worker_index, tcp_port, udp_port, shared_stats, ready):
+    server = worker_class(tcp_port, udp_port, reuse_port=True)
+    server.worker_index = worker_index
+    server.shared_stats = shared_stats
+    ready.release()
+    server.run()
+
+
+class ServerCluster:
+    """
+    N server processes bound to the same TCP and UDP ports with SO_REUSEPORT,
+    so the kernel spreads connections and datagrams across them and each
+    worker gets its own GIL. This process only answers discovery and prints
+    the combined statistics.
+    """
+    # discovery only needs is_running and the two ports, the endpoint only statistics()
+    start_discovery = Server.start_discovery
+    offer_broadcast = Server.offer_broadcast
+    answer_solicitations = Server.answer_solicitations
+    start_metrics_endpoint = Server.start_metrics_endpoint
+
+    def __init__(self, workers=Config.SERVER_WORKERS, worker_class=ThreadWorker):
+        self.workers = workers
+        self.worker_class = worker_class
+        self.is_running = True
+
+        # held until every worker has bound, so the ephemeral ports cannot be taken meanwhile
+        self.tcp_reservation = self.reserve_port(socket.SOCK_STREAM, 0)
+        self.SERVER_TCP_PORT = self.tcp_reservation.getsockname()[1]
+        self.udp_reservation = self.reserve_port(socket.SOCK_DGRAM, 0)
+        self.SERVER_UDP_PORT = self.udp_reservation.getsockname()[1]
+        self.SERVER_IP = socket.gethostbyname(socket.gethostname())
+
+        # spawn, not fork: a forked worker would inherit the reservations and keep them open
+        self.context = multiprocessing.get_context('spawn')
+        self.shared_stats = self.context.Array('d', workers * len(STAT_FIELDS), lock=False)
+        self.processes = []
+
+    @staticmethod
+    def reserve_port(kind, port):
+        reservation = socket.socket(socket.AF_INET, kind)
+        reservation.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        reservation.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        reservation.bind(('', port))
+        return reservation
+
+    def statistics(self):
+        merged = {}
+        for offset, field in enumerate(STAT_FIELDS):
+            values = [self.shared_stats[worker * len(STAT_FIELDS) + offset] for worker in range(self.workers)]
+            merged[field] = STAT_MERGE.get(field, sum)(values)
+        merged['pool_average_wait'] /= self.workers
+        return merged
+
+    def print_statistics(self):
+        print(f"{Colors.BLUE}Workers alive: {Colors.CYAN}"
+              f"{sum(process.is_alive() for process in self.processes)}/{self.workers}{Colors.ENDC}")
+        Server.print_statistics_view(self.statistics())
+
+    def start_workers(self):
+        ready = self.context.Semaphore(0)
+        for worker_index in range(self.workers):
+            process = self.context.Process(
+                target=run_worker,
+                args=(self.worker_class, worker_index, self.SERVER_TCP_PORT, self.SERVER_UDP_PORT,
+                      self.shared_stats, ready),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        # a worker that fails to start exits without releasing, so keep an eye on the processes
+        started = 0
+        while started < self.workers:
+            if ready.acquire(timeout=0.5):
+                started += 1
+                continue
+            dead = [process for process in self.processes if not process.is_alive()]
+            if dead:
+                raise RuntimeError(f"{len(dead)} worker(s) exited during startup "
+                                   f"(exit codes {', '.join(str(process.exitcode) for process in dead)})")
+        # the udp reservation would otherwise get its share of the datagrams
+        self.udp_reservation.close()
+        self.tcp_reservation.close()
+
+    def run(self):
+        metrics_endpoint = None
+        try:
+            self.start_workers()
+            metrics_endpoint = self.start_metrics_endpoint()
+            self.start_discovery()
+            print(f"{Colors.GREEN}Server cluster of {self.workers} workers listening on {self.SERVER_IP}, "
+                  f"TCP {self.SERVER_TCP_PORT}, UDP {self.SERVER_UDP_PORT}{Colors.ENDC}")
+            while self.is_running:
+                time.sleep(10)
+                self.print_statistics()
+
+        except KeyboardInterrupt:
+            print(f"{Colors.YELLOW}Server cluster shutting down manually...{Colors.ENDC}")
+        except RuntimeError as e:
+            print(f"{Colors.RED}Server cluster failed to start: {e}{Colors.ENDC}")
+        finally:
+            self.is_running = False
+            if metrics_endpoint:
+                metrics_endpoint.stop()
+            for process in self.processes:
+                process.join(timeout=2)
+                if process.is_alive():
+                    process.terminate()
+            print(f"{Colors.GREEN}Server cluster shutdown complete{Colors.ENDC}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run several server processes on shared ports")
+    parser.add_argument('workers', type=int, nargs='?', default=Config.SERVER_WORKERS)
+    parser.add_argument('--asyncio', action='store_true', help="use the asyncio engine in every worker")
+    args = parser.parse_args()
+    cluster = ServerCluster(args.workers, AsyncWorker if args.asyncio else ThreadWorker)
+    print(f"{Colors.HEADER}{Colors.BOLD}Server Started{Colors.ENDC}")
+    cluster.run()
@@ -1,39 +1,60 @@
+import os
+import queue
 import socket
+import tempfile
 import time
-import struct
 import threading
 import sys
-from concurrent.futures import ThreadPoolExecutor
-from multiprocessing import Manager
 from Config import Colors, Config, Format
-import math
+from UdpScheduler import UdpSession, UdpSessionScheduler
+from Protocol import is_solicit, message_type, pack_offer, parse_nack, parse_request
+from Discovery import announce_address, enable_announcing, open_listener
+from MemoryBudget import MemoryBudget, peak_rss
+from Pacing import TokenBucket
+from ClientRegistry import ClientRegistry
+from ElasticExecutor import ElasticExecutor
+from Log import log
+from Metrics import MetricsEndpoint, ShardedCounter, ShardedGauge, TransferMetrics
+from TcpRequest import TcpRequest, TCP_REQUEST, PATTERNS, PATTERN_A, PATTERN_ZERO, PATTERN_SEQUENCE, PATTERN_RANDOM
 
 
+POOL_FIELDS = ['pool_workers', 'pool_idle', 'pool_queue', 'pool_average_wait', 'pool_max_wait', 'pool_rejected']
+
 class Server:
-    def __init__(self) -> object:
+    def __init__(self, tcp_port=0, udp_port=0, reuse_port=False) -> object:
         """
         :rtype: object
 
+        tcp_port/udp_port of 0 pick free ports; reuse_port lets several
+        processes bind the same ports (SO_REUSEPORT) and share the load.
         """
         try:
-            #statistics
-            self.total_tcp_data_sent = 0
-            self.total_udp_data_sent = 0
-            self.tcp_connections = 0
-            self.udp_connections = 0
-            self.transfer_errors = 0
+            #statistics, sharded per thread and merged in statistics()
+            self.total_tcp_data_sent = ShardedCounter()
+            self.total_udp_data_sent = ShardedCounter()
+            self.tcp_connections = ShardedCounter()
+            self.tcp_requests = ShardedCounter()
+            self.udp_connections = ShardedCounter()
+            self.transfer_errors = ShardedCounter()
+            self.active_tcp_requests = ShardedGauge()
+            self.tcp_metrics = TransferMetrics()
+            self.udp_metrics = TransferMetrics()
 
             #tcp socket
             self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.tcp_socket.bind(('', 0))
+            if reuse_port:
+                self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.tcp_socket.bind(('', tcp_port))
             self.tcp_socket.settimeout(1.0)
             self.SERVER_TCP_PORT = self.tcp_socket.getsockname()[1]
 
             #udp socket
             self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.udp_socket.bind(('', 0))
+            if reuse_port:
+                self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.udp_socket.bind(('', udp_port))
             self.udp_socket.settimeout(1.0)
             self.SERVER_UDP_PORT = self.udp_socket.getsockname()[1]
 
@@ -43,12 +64,26 @@ class Server:
 
             self.tcp_socket.listen(Config.MAX_CLIENTS)
 
-            # thread-safe dictionary for monitoring clients
-            manager = Manager()
-            self.active_clients = manager.dict()
+            # per-client connection counts, shared by all handler threads
+            self.active_clients = ClientRegistry()
+
+            # one preallocated payload per pattern shared by every tcp transfer; the sequence one
+            # has a spare cycle so a chunk can start at any offset modulo 256
+            self.tcp_payloads = {
+                PATTERN_A: memoryview(b'A' * Config.TCP_SEND_SIZE),
+                PATTERN_ZERO: memoryview(bytes(Config.TCP_SEND_SIZE)),
+                PATTERN_SEQUENCE: memoryview(bytes(range(256)) * (Config.TCP_SEND_SIZE // 256 + 2)),
+                PATTERN_RANDOM: memoryview(os.urandom(Config.TCP_SEND_SIZE)),
+            }
+            self.tcp_payload = self.tcp_payloads[PATTERN_A]
+            self.tcp_payload_file = self.create_payload_file()
+
+            self.udp_memory = MemoryBudget(Config.UDP_SERVER_MEMORY)
+            self.udp_pacer = TokenBucket(Config.UDP_SERVER_RATE)
+            self.udp_scheduler = self.create_udp_scheduler()
 
             self.is_running = True
-            self.thread_pool = ThreadPoolExecutor(max_workers=Config.MAX_CLIENTS)
+            self.thread_pool = self.create_thread_pool()
 
             print(f"{Colors.BLUE}Server IP address: {Colors.CYAN}{self.SERVER_IP}{Colors.ENDC}")
             print(f"{Colors.BLUE}TCP Port: {Colors.CYAN}{self.SERVER_TCP_PORT}{Colors.ENDC}")
@@ -59,52 +94,136 @@ class Server:
             sys.exit(1)
 
 
+    #point-in-time counters, also what cluster workers publish to the parent
+    def statistics(self):
+        clients = self.active_clients.snapshot()
+        return {
+            'tcp_bytes': self.total_tcp_data_sent.value,
+            'udp_bytes': self.total_udp_data_sent.value,
+            'tcp_connections': self.tcp_connections.value,
+            'tcp_requests': self.tcp_requests.value,
+            'udp_connections': self.udp_connections.value,
+            'active_clients': len(clients),
+            'active_tcp': sum(c['tcp_count'] for c in clients.values()),
+            'active_udp': sum(c['udp_count'] for c in clients.values()),
+            'active_tcp_requests': self.active_tcp_requests.value,
+            'live_udp_sessions': self.live_udp_sessions(),
+            'waiting_udp_sessions': self.waiting_udp_sessions(),
+            'udp_memory_in_use': self.udp_memory.in_use,
+            'udp_memory_limit': self.udp_memory.limit,
+            'udp_memory_peak': self.udp_memory.peak,
+            'peak_rss': peak_rss() or 0,
+            **self.pool_statistics(),
+            'transfer_errors': self.transfer_errors.value,
+            **self.tcp_metrics.statistics('tcp'),
+            **self.udp_metrics.statistics('udp'),
+        }
+
+    #worker pool figures; engines without a pool report zeros so every server has the same fields
+    def pool_statistics(self):
+        pool = self.thread_pool
+        if pool is None:
+            return dict.fromkeys(POOL_FIELDS, 0)
+        return {
+            'pool_workers': pool.workers,
+            'pool_idle': pool.idle,
+            'pool_queue': pool.queue_depth,
+            'pool_average_wait': pool.average_wait,
+            'pool_max_wait': pool.max_wait,
+            'pool_rejected': pool.rejected,
+        }
+
     #periodic statistics
     def print_statistics(self) :
-
+        self.print_statistics_view(self.statistics())
+        for protocol, metrics in (('TCP', self.tcp_metrics), ('UDP', self.udp_metrics)):
+            series = ', '.join(Format.format_speed(size * 8) for size in metrics.throughput_series(10))
+            print(f"{Colors.BLUE}{protocol} throughput, last 10 s: {Colors.CYAN}{series}{Colors.ENDC}")
+
+    @staticmethod
+    def print_statistics_view(stats):
+        # queued transfer events belong before the dump
+        log.flush()
         print(f"{Colors.GREEN}{Colors.BOLD}Server Statistics:{Colors.ENDC}")
         print(
-            f"{Colors.BLUE}Total TCP data sent: {Colors.CYAN}{Format.format_size(self.total_tcp_data_sent)}{Colors.ENDC}")
+            f"{Colors.BLUE}Total TCP data sent: {Colors.CYAN}{Format.format_size(stats['tcp_bytes'])}{Colors.ENDC}")
         print(
-            f"{Colors.BLUE}Total UDP data sent: {Colors.CYAN}{Format.format_size(self.total_udp_data_sent)}{Colors.ENDC}")
-        print(f"{Colors.BLUE}TCP connections handled: {Colors.CYAN}{self.tcp_connections}{Colors.ENDC}")
-        print(f"{Colors.BLUE}UDP connections handled: {Colors.CYAN}{self.udp_connections}{Colors.ENDC}")
-        print(f"{Colors.RED}Transfer errors: {Colors.CYAN}{self.transfer_errors}{Colors.ENDC}")
-
-    #adjusting pool thread on reaching thresh
-    def adjust_thread_pool(self, new_max_workers):
-        self.thread_pool.shutdown(wait=False)
-        self.thread_pool = ThreadPoolExecutor(max_workers=new_max_workers)
-
-    #monitoring thread load
+            f"{Colors.BLUE}Total UDP data sent: {Colors.CYAN}{Format.format_size(stats['udp_bytes'])}{Colors.ENDC}")
+        print(f"{Colors.BLUE}TCP connections handled: {Colors.CYAN}{int(stats['tcp_connections'])}"
+              f" ({int(stats['tcp_requests'])} requests){Colors.ENDC}")
+        print(f"{Colors.BLUE}UDP connections handled: {Colors.CYAN}{int(stats['udp_connections'])}{Colors.ENDC}")
+        print(
+            f"{Colors.BLUE}Active clients: {Colors.CYAN}{int(stats['active_clients'])}"
+            f" ({int(stats['active_tcp'])} TCP, {int(stats['active_udp'])} UDP connections){Colors.ENDC}")
+        print(f"{Colors.BLUE}TCP requests in progress: {Colors.CYAN}{int(stats['active_tcp_requests'])}{Colors.ENDC}")
+        print(f"{Colors.BLUE}Live UDP sessions: {Colors.CYAN}{int(stats['live_udp_sessions'])}{Colors.ENDC}")
+        print(f"{Colors.BLUE}UDP sessions waiting for memory: {Colors.CYAN}{int(stats['waiting_udp_sessions'])}{Colors.ENDC}")
+        print(
+            f"{Colors.BLUE}UDP buffer memory: {Colors.CYAN}{Format.format_size(stats['udp_memory_in_use'])}"
+            f" / {Format.format_size(stats['udp_memory_limit'])}"
+            f" (peak {Format.format_size(stats['udp_memory_peak'])}){Colors.ENDC}")
+        if stats['peak_rss']:
+            print(f"{Colors.BLUE}Peak process memory: {Colors.CYAN}{Format.format_size(stats['peak_rss'])}{Colors.ENDC}")
+        if stats['pool_workers']:
+            print(
+                f"{Colors.BLUE}Worker pool: {Colors.CYAN}{int(stats['pool_workers'])} threads ({int(stats['pool_idle'])} idle),"
+                f" queue {int(stats['pool_queue'])}, avg wait {stats['pool_average_wait'] * 1000:.1f} ms,"
+                f" max wait {stats['pool_max_wait'] * 1000:.1f} ms, rejected {int(stats['pool_rejected'])}{Colors.ENDC}")
+        for protocol in ('tcp', 'udp'):
+            print(f"{Colors.BLUE}{protocol.upper()} timing p50 / p99 / max:{Colors.ENDC}")
+            for name, label in (('first_byte', 'First byte'), ('send_block', 'Send blocked'),
+                                ('duration', 'Transfer')):
+                print(f"  {Colors.BLUE}{label}: {Colors.CYAN}"
+                      + ' / '.join(f"{stats[f'{protocol}_{name}_{stat}'] * 1000:.2f} ms" for stat in ('p50', 'p99', 'max'))
+                      + Colors.ENDC)
+        print(f"{Colors.RED}Transfer errors: {Colors.CYAN}{int(stats['transfer_errors'])}{Colors.ENDC}")
+
+    #growing the pool when connections queue up with no idle worker
     def monitor_load(self):
         while self.is_running:
-            active_connections = len(self.active_clients)
-            if active_connections > Config.MAX_CLIENTS:  # Example: Threshold for scaling
-                new_pool_size = min(Config.MAX_CLIENTS + 10, active_connections + 5)
-                print(f"Adjusting thread pool size to: {new_pool_size}")
-                self.adjust_thread_pool(new_pool_size)
-            time.sleep(10)  # Monitor every 10 seconds
+            if self.thread_pool.wait_for_pressure(timeout=1.0):
+                added = self.thread_pool.scale_up()
+                if added:
+                    log.info("Adjusting thread pool size to: {workers}", workers=self.thread_pool.workers)
+                else:
+                    # queued work is young; look again once the oldest task reaches the threshold
+                    time.sleep(max(Config.POOL_WAIT_THRESHOLD - self.thread_pool.oldest_wait(), 0.001))
+
+    #prometheus endpoint over statistics(), when Config.METRICS_PORT is set
+    def start_metrics_endpoint(self):
+        if Config.METRICS_PORT is None:
+            return None
+        endpoint = MetricsEndpoint(self.statistics, Config.METRICS_HOST, Config.METRICS_PORT)
+        endpoint.start()
+        return endpoint
 
     #running server with different daemon threads
     def run(self):
+        metrics_endpoint = None
         try:
-            # Start broadcast and UDP handler threads
-            threading.Thread(target=self.offer_broadcast, daemon=True).start()
+            metrics_endpoint = self.start_metrics_endpoint()
+            # Start discovery and UDP handler threads
+            self.start_discovery()
             threading.Thread(target=self.handle_udp_requests, daemon=True).start()
+            threading.Thread(target=self.udp_scheduler.run, daemon=True).start()
             threading.Thread(target=self.periodic_statistics, daemon=True).start()
             threading.Thread(target=self.monitor_load, daemon=True).start()
 
             print(f"{Colors.GREEN}Server is running and listening on IP address {self.SERVER_IP}{Colors.ENDC}")
-            while True:  # Keep the server running indefinitely
+            while self.is_running:  # until stop() or Ctrl+C
                 try:
                     connection, address = self.tcp_socket.accept()
-                    print(f"{Colors.BLUE}✓ New connection from {address}{Colors.ENDC}")
-                    self.thread_pool.submit(self.handle_tcp_client, connection, address)
+                    log.debug("{BLUE}✓ New connection from {address}{ENDC}", address=address)
+                    self.thread_pool.submit(self.handle_tcp_client, connection, address,
+                                            timeout=Config.POOL_SUBMIT_TIMEOUT)
+                except queue.Full:
+                    log.error("{RED}✗ Worker queue full, dropping connection from {address}{ENDC}", address=address)
+                    connection.close()
+                    self.transfer_errors.add()
                 except socket.timeout:
                     continue  # Timeout is used to periodically check `is_running`
                 except Exception as e:
-                    print(f"{Colors.RED}✗ Error accepting connection: {e}{Colors.ENDC}")
+                    log.error("{RED}✗ Error accepting connection: {error}{ENDC}", error=e)
                     time.sleep(1)
 
         except KeyboardInterrupt:
@@ -112,177 +231,333 @@ class Server:
         finally:
             # Gracefully shutdown the server and clean up resources
             self.is_running = False
+            self.udp_scheduler.stop()
+            if metrics_endpoint:
+                metrics_endpoint.stop()
             self.tcp_socket.close()
             self.udp_socket.close()
             self.thread_pool.shutdown(wait=False)
+            log.flush()
             print(f"{Colors.GREEN}Server shutdown complete{Colors.ENDC}")
 
-    #broadcasting
+    #lets another thread end run(); loops notice within their one second timeouts
+    def stop(self):
+        self.is_running = False
+
+    #periodic offers for passive clients, immediate answers for soliciting ones
+    def start_discovery(self):
+        threading.Thread(target=self.offer_broadcast, daemon=True).start()
+        threading.Thread(target=self.answer_solicitations, daemon=True).start()
+
+    #broadcasting, or multicasting when Config.OFFER_MULTICAST_GROUP is set
     def offer_broadcast(self):
         udp_broadcast = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        udp_broadcast.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        enable_announcing(udp_broadcast)
         udp_broadcast.bind(("", 0))
 
         while self.is_running:
             try:
-                message = struct.pack(Config.OFFER_STRUCT_FORMAT,
-                                      Config.MAGIC_COOKIE,
-                                      Config.OFFER_TYPE,
-                                      self.SERVER_UDP_PORT,
-                                      self.SERVER_TCP_PORT)
-                udp_broadcast.sendto(message, ('<broadcast>', Config.OFFER_UDP_PORT))
+                message = pack_offer(self.SERVER_UDP_PORT, self.SERVER_TCP_PORT)
+                udp_broadcast.sendto(message, announce_address(Config.OFFER_UDP_PORT))
                 time.sleep(1)
 
             except Exception as e:
-                print(f"{Colors.RED}Broadcast error: {e}{Colors.ENDC}")
+                log.error("{RED}Broadcast error: {error}{ENDC}", error=e)
                 time.sleep(2)
         udp_broadcast.close()
 
+    #a unicast offer straight back to every solicitation, so clients need not wait for the next broadcast
+    def answer_solicitations(self):
+        try:
+            solicit_socket = open_listener(Config.SOLICIT_UDP_PORT)
+        except OSError as e:
+            log.error("{RED}Not answering solicitations on port {port}: {error}{ENDC}",
+                      port=Config.SOLICIT_UDP_PORT, error=e)
+            return
+        solicit_socket.settimeout(1)
+        offer = pack_offer(self.SERVER_UDP_PORT, self.SERVER_TCP_PORT)
+
+        while self.is_running:
+            try:
+                data, address = solicit_socket.recvfrom(Config.SERVER_BUFFER_SIZE)
+                if is_solicit(data):
+                    solicit_socket.sendto(offer, address)
+                    log.debug("{BLUE}Answered solicitation from {address}{ENDC}", address=address)
+            except socket.timeout:
+                continue
+            except Exception as e:
+                log.error("{RED}Solicitation error: {error}{ENDC}", error=e)
+                time.sleep(1)
+        solicit_socket.close()
+
+
+    #in-memory file backing the payload when sendfile() is enabled
+    def create_payload_file(self):
+        if not Config.TCP_USE_SENDFILE:
+            return None
+        if hasattr(os, 'memfd_create'):
+            payload_file = os.fdopen(os.memfd_create('tcp-payload'), 'w+b')
+        else:
+            payload_file = tempfile.TemporaryFile()
+        payload_file.write(self.tcp_payload)
+        payload_file.flush()
+        return payload_file
+
+    #the request's pacing rate, never above the server's own TCP_RATE_LIMIT
+    @staticmethod
+    def tcp_rate(request):
+        rates = [rate for rate in (request.rate, Config.TCP_RATE_LIMIT) if rate]
+        return min(rates) if rates else 0
+
+    #send size for a request: its own chunk size if it asked for one, at most TCP_SEND_SIZE,
+    #and at most TCP_PACING_INTERVAL worth of bytes when paced so no write is a burst
+    @staticmethod
+    def tcp_chunk_size(request, rate=0):
+        chunk_size = min(request.chunk_size or Config.TCP_SEND_SIZE, Config.TCP_SEND_SIZE)
+        if rate:
+            chunk_size = min(chunk_size, max(int(rate * Config.TCP_PACING_INTERVAL), 1))
+        return chunk_size
+
+    #seconds to wait before a write that brings the transfer to bytes_sent, so it stays under rate;
+    #start_time is time.monotonic()
+    @staticmethod
+    def tcp_pacing_delay(start_time, bytes_sent, rate):
+        if not rate:
+            return 0
+        return start_time + bytes_sent / rate - time.monotonic()
+
+    #the next size bytes of the request's payload, bytes_sent into it, without copying
+    def tcp_payload_chunk(self, request, bytes_sent, size):
+        start = (request.offset + bytes_sent) % 256 if request.pattern == PATTERN_SEQUENCE else 0
+        return self.tcp_payloads[request.pattern][start:start + size]
+
+    #sending request.length bytes in chunk sized writes without copying the payload,
+    #timing every write and the first byte against request_ns
+    def send_tcp_payload(self, connection, request, start_time, request_ns):
+        bytes_sent = 0
+        rate = self.tcp_rate(request)
+        chunk_size = self.tcp_chunk_size(request, rate)
+        # the in-memory file only holds the default pattern
+        payload_file = self.tcp_payload_file if request.pattern == PATTERN_A else None
+        while bytes_sent < request.length and self.is_running:
+            to_send = min(chunk_size, request.length - bytes_sent)
+            delay = self.tcp_pacing_delay(start_time, bytes_sent + to_send, rate)
+            if delay > 0:
+                time.sleep(delay)
+            send_started = time.monotonic_ns()
+            try:
+                if payload_file is not None:
+                    sent = connection.sendfile(payload_file, 0, to_send)
+                else:
+                    connection.sendall(self.tcp_payload_chunk(request, bytes_sent, to_send))
+                    sent = to_send
+            except socket.timeout:
+                break
+            if sent == 0:
+                break
+            send_finished = time.monotonic_ns()
+            if not bytes_sent:
+                self.tcp_metrics.first_byte.record(send_finished - request_ns)
+            self.tcp_metrics.record_send(sent, send_started, send_finished)
+            bytes_sent += sent
+            self.total_tcp_data_sent.add(sent)
+        return bytes_sent
 
     #tracking clients for amount of connections
     def track_client(self, client_address, conn_type):
-        if client_address not in self.active_clients:
-            self.active_clients[client_address] = {'tcp_count': 0, 'udp_count': 0}
-
-        client_data = self.active_clients[client_address]
-        client_data[f'{conn_type}_count'] += 1
-        self.active_clients[client_address] = client_data
+        self.active_clients.track(client_address, conn_type)
 
     def untrack_client(self, client_address, conn_type):
-        if client_address in self.active_clients:
-            client_data = self.active_clients[client_address]
-            client_data[f'{conn_type}_count'] -= 1
-            if sum(client_data.values()) == 0:
-                del self.active_clients[client_address]
-            else:
-                self.active_clients[client_address] = client_data
-
-    #tcp client handling
+        self.active_clients.untrack(client_address, conn_type)
+
+    #next request on a connection, a binary frame or a legacy ascii line; None at end of stream.
+    #reading exactly the frame size or up to the newline copes with requests split across segments
+    @staticmethod
+    def read_tcp_request(requests):
+        first_byte = requests.peek(1)[:1]
+        if not first_byte:
+            return None
+        if TcpRequest.is_frame(first_byte[0]):
+            return TcpRequest.from_frame(requests.read(TCP_REQUEST.size))
+        line = requests.readline(Config.SERVER_BUFFER_SIZE).decode().strip()
+        return TcpRequest.from_ascii(line) if line else None
+
+    #transfer reports are logged as fields and rendered by the log writer, off the sending thread
+    @staticmethod
+    def report_tcp_request(address, bytes_sent, duration):
+        log.info(Server.format_tcp_report, address=address, bytes_sent=bytes_sent, duration=duration)
+
+    @staticmethod
+    def format_tcp_report(address, bytes_sent, duration):
+        speed = (bytes_sent * 8) / duration if duration > 0 else 0
+        return (
+            f"{Colors.GREEN}✓ TCP transfer complete to {Colors.CYAN}{address}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Sent: {Colors.CYAN}{Format.format_size(bytes_sent)}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Time: {Colors.CYAN}{duration:.2f}s{Colors.ENDC}\n"
+            f"  {Colors.BLUE}└─ Speed: {Colors.CYAN}{Format.format_speed(speed)}{Colors.ENDC}"
+        )
+
+    @staticmethod
+    def format_tcp_request(address, request):
+        return f"{Colors.BLUE}Requested size: {Colors.CYAN}{Server.describe_tcp_request(request)}{Colors.ENDC}"
+
+    @staticmethod
+    def describe_tcp_request(request):
+        description = Format.format_size(request.length)
+        if request.offset:
+            description += f" from offset {request.offset}"
+        if request.chunk_size:
+            description += f", {Format.format_size(request.chunk_size)} chunks"
+        if request.rate:
+            description += f", paced at {Format.format_speed(request.rate * 8)}"
+        if request.pattern != PATTERN_A:
+            description += f", {next(name for name, code in PATTERNS.items() if code == request.pattern)} pattern"
+        return description
+
+    #tcp client handling: one request, or request after request while the client asks for keep-alive.
+    #pipelined requests simply wait in the buffered reader
     def handle_tcp_client(self, connection, address):
         self.track_client(address[0], 'tcp')
-        self.tcp_connections += 1
+        self.tcp_connections.add()
         connection.settimeout(30)
-        if len(self.active_clients) > Config.MAX_CLIENTS:
-            new_pool_size = Config.MAX_CLIENTS + 5
-            print(f"Adjusting thread pool size to handle high load: {new_pool_size}")
-            self.adjust_thread_pool(new_pool_size)
+        # back-to-back keep-alive responses would otherwise stall on Nagle and delayed ACKs
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        requests = connection.makefile('rb')
 
         try:
-            request = connection.recv(Config.SERVER_BUFFER_SIZE).decode().strip()
-            if not request:
-                return
-
-            file_size = int(request)
-            if file_size <= 0:
-                return
-
-            print(f"{Colors.GREEN}➜ New TCP client connected from {Colors.CYAN}{address}{Colors.ENDC}")
-            print(f"{Colors.BLUE}Requested size: {Colors.CYAN}{Format.format_size(file_size)}{Colors.ENDC}")
-            bytes_sent = 0
-            start_time = time.time()
-
-            def generate_data():
-                for _ in range(file_size // Config.CHUNK_SIZE):
-                    yield b'A' * Config.CHUNK_SIZE
-                # Handle the remainder
-                yield b'A' * (file_size % Config.CHUNK_SIZE)
-
-            for chunk in generate_data():
+            keep_alive = True
+            first_request = True
+            while keep_alive and self.is_running:
                 try:
-                    connection.sendall(chunk)
-                    bytes_sent += len(chunk)
+                    request = self.read_tcp_request(requests)
+                    request_ns = time.monotonic_ns()
                 except socket.timeout:
+                    if first_request:
+                        raise
+                    break  # idle keep-alive connection
+                if request is None:
+                    return
+
+                keep_alive = request.keep_alive
+                self.tcp_requests.add()
+                if first_request:
+                    log.info("{GREEN}➜ New TCP client connected from {CYAN}{address}{ENDC}", address=address)
+                    first_request = False
+                log.info(self.format_tcp_request, address=address, request=request)
+
+                connection.settimeout(30)
+                start_time = time.monotonic()
+                self.active_tcp_requests.add()
+                try:
+                    bytes_sent = self.send_tcp_payload(connection, request, start_time, request_ns)
+                finally:
+                    self.active_tcp_requests.sub()
+                if bytes_sent == request.length:
+                    self.tcp_metrics.duration.record(time.monotonic_ns() - request_ns)
+                self.report_tcp_request(address, bytes_sent, time.monotonic() - start_time)
+                if bytes_sent < request.length:
                     break
-                time.sleep(0.01)  # Yield control to avoid hogging the CPU
-            self.total_tcp_data_sent += bytes_sent
-
-            duration = time.time() - start_time
-            speed = (bytes_sent * 8) / duration if duration > 0 else 0
-
-            print(
-                f"{Colors.GREEN}✓ TCP transfer complete to {Colors.CYAN}{address}{Colors.ENDC}\n"
-                f"  {Colors.BLUE}├─ Sent: {Colors.CYAN}{Format.format_size(bytes_sent)}{Colors.ENDC}\n"
-                f"  {Colors.BLUE}├─ Time: {Colors.CYAN}{duration:.2f}s{Colors.ENDC}\n"
-                f"  {Colors.BLUE}└─ Speed: {Colors.CYAN}{Format.format_speed(speed)}{Colors.ENDC}"
-            )
+                connection.settimeout(Config.TCP_KEEPALIVE_TIMEOUT)
 
         except Exception as e:
-            print(f"{Colors.RED}✗ Error handling TCP client {address}: {e}{Colors.ENDC}")
-            self.transfer_errors += 1
+            log.error("{RED}✗ Error handling TCP client {address}: {error}{ENDC}", address=address, error=e)
+            self.transfer_errors.add()
         finally:
+            requests.close()
             connection.close()
             self.untrack_client(address[0], 'tcp')
 
-    #handling udp requests
+    #handling udp requests: only validates and queues, the scheduler does the sending
     def handle_udp_requests(self):
         while self.is_running:
             try:
                 data, address = self.udp_socket.recvfrom(Config.SERVER_BUFFER_SIZE)
 
-                if len(data) < struct.calcsize(Config.REQUEST_STRUCT_FORMAT):
+                if message_type(data) == Config.NACK_TYPE:
+                    feedback = parse_nack(data)
+                    if feedback:
+                        self.udp_scheduler.feedback(address, *feedback)
                     continue
 
-                self.track_client(address[0], 'udp')
-                self.udp_connections += 1
-
-                try:
-                    magic_cookie, message_type, file_size = struct.unpack(Config.REQUEST_STRUCT_FORMAT, data)
-                    if magic_cookie != Config.MAGIC_COOKIE or message_type != Config.REQUEST_TYPE:
-                        continue
-
-                    print(f"{Colors.GREEN}➜ New UDP request from {Colors.CYAN}{address}{Colors.ENDC}")
-                    print(f"{Colors.BLUE}Requested size: {Colors.CYAN}{Format.format_size(file_size)}{Colors.ENDC}")
-
-                    total_segments = math.ceil(file_size / Config.CHUNK_SIZE)
-                    data_to_send = b'A' * file_size
-                    start_time = time.time()
-                    bytes_sent = 0
-
-                    for segment_number in range(total_segments):
-                        # Calculate payload for this segment
-                        start = segment_number * Config.CHUNK_SIZE
-                        end = start + Config.CHUNK_SIZE
-                        payload = data_to_send[start:end]
-
-                        response_format = f"{Config.PAYLOAD_STRUCT_FORMAT}{len(payload)}s"  # Struct format for the response
-                        response_data = struct.pack(
-                            response_format,
-                            Config.MAGIC_COOKIE,  # Magic cookie (4 bytes)
-                            Config.PAYLOAD_TYPE,  # Message type (1 byte)
-                            total_segments,  # Total segment count (8 bytes)
-                            segment_number + 1,  # Current segment number (8 bytes)
-                            payload  # Actual payload (variable size)
-                        )
-
-                        # Send the response
-                        self.udp_socket.sendto(response_data, address)
-                        bytes_sent += len(response_data)
-
-                    self.total_udp_data_sent += bytes_sent
-                    duration = time.time() - start_time
-                    speed = (bytes_sent * 8) / duration if duration > 0 else 0
-                    print(
-                        f"{Colors.GREEN}✓ UDP transfer complete to {Colors.CYAN}{address}{Colors.ENDC}\n"
-                        f"  {Colors.BLUE}├─ Sent: {Colors.CYAN}{Format.format_size(bytes_sent)}{Colors.ENDC}\n"
-                        f"  {Colors.BLUE}├─ Packets: {Colors.CYAN}{total_segments}{Colors.ENDC}\n"
-                        f"  {Colors.BLUE}├─ Time: {Colors.CYAN}{duration:.2f}s{Colors.ENDC}\n"
-                        f"  {Colors.BLUE}└─ Speed: {Colors.CYAN}{Format.format_speed(speed)}{Colors.ENDC}"
-                    )
+                file_size = parse_request(data)
+                if file_size is None:
+                    continue
 
-                except Exception as e:
-                    print(f"{Colors.RED}✗ UDP transfer error to {address}: {e}{Colors.ENDC}")
-                finally:
-                    self.untrack_client(address[0], 'udp')
+                self.track_client(address[0], 'udp')
+                self.udp_connections.add()
 
+                self.report_udp_request(address, file_size)
+                self.udp_scheduler.add(UdpSession(address, file_size))
 
             except socket.timeout:
-                time.sleep(0.1)  # Prevent busy waiting by adding a small delay
                 continue
             except Exception as e:
-                print(f"{Colors.RED}✗ UDP handler error: {e}{Colors.ENDC}")
-                self.transfer_errors += 1
+                log.error("{RED}✗ UDP handler error: {error}{ENDC}", error=e)
+                self.transfer_errors.add()
                 time.sleep(1)
 
+    def finish_udp_session(self, session):
+        self.total_udp_data_sent.add(session.bytes_sent)
+        if session.last_sent_ns is not None:
+            self.udp_metrics.duration.record(session.last_sent_ns - session.created_ns)
+        self.report_udp_session(session)
+        self.untrack_client(session.address[0], 'udp')
+
+    @staticmethod
+    def report_udp_request(address, file_size):
+        log.info(Server.format_udp_request, address=address, file_size=file_size)
+
+    @staticmethod
+    def format_udp_request(address, file_size):
+        return (f"{Colors.GREEN}➜ New UDP request from {Colors.CYAN}{address}{Colors.ENDC}\n"
+                f"{Colors.BLUE}Requested size: {Colors.CYAN}{Format.format_size(file_size)}{Colors.ENDC}")
+
+    @staticmethod
+    def report_udp_session(session):
+        # lingering for NACKs is not part of the transfer
+        log.info(Server.format_udp_report, address=session.address, bytes_sent=session.bytes_sent,
+                 packets=session.total_segments, retransmitted=session.retransmitted_segments,
+                 rate=session.pacer.rate, duration=session.last_sent - session.start_time)
+
+    @staticmethod
+    def format_udp_report(address, bytes_sent, packets, retransmitted, rate, duration):
+        speed = (bytes_sent * 8) / duration if duration > 0 else 0
+        return (
+            f"{Colors.GREEN}✓ UDP transfer complete to {Colors.CYAN}{address}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Sent: {Colors.CYAN}{Format.format_size(bytes_sent)}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Packets: {Colors.CYAN}{packets}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Retransmitted: {Colors.CYAN}{retransmitted}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Final send rate: {Colors.CYAN}{Server.format_udp_rate(rate)}{Colors.ENDC}\n"
+            f"  {Colors.BLUE}├─ Time: {Colors.CYAN}{duration:.2f}s{Colors.ENDC}\n"
+            f"  {Colors.BLUE}└─ Speed: {Colors.CYAN}{Format.format_speed(speed)}{Colors.ENDC}"
+        )
+
+    @staticmethod
+    def format_udp_rate(rate):
+        if not rate:
+            return "unpaced"
+        return Format.format_speed(rate * 8)
+
+    def fail_udp_session(self, session, error):
+        log.error("{RED}✗ UDP transfer error to {address}: {error}{ENDC}", address=session.address, error=error)
+        self.total_udp_data_sent.add(session.bytes_sent)
+        self.transfer_errors.add()
+        self.untrack_client(session.address[0], 'udp')
+
+    def create_thread_pool(self):
+        return ElasticExecutor(Config.POOL_MIN_WORKERS, Config.POOL_MAX_WORKERS,
+                               Config.POOL_QUEUE_SIZE, Config.POOL_IDLE_TIMEOUT)
+
+    def create_udp_scheduler(self):
+        return UdpSessionScheduler(self.udp_socket, self.udp_memory, self.udp_pacer,
+                                   self.finish_udp_session, self.fail_udp_session, self.udp_metrics)
+
+    def live_udp_sessions(self):
+        return self.udp_scheduler.live_sessions
+
+    def waiting_udp_sessions(self):
+        return self.udp_scheduler.waiting_sessions
+
     #periodics statistcs
     def periodic_statistics(self):
         while self.is_running:
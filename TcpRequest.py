@@ -0,0 +1,81 @@
+from Config import Config
+from Protocol import TCP_REQUEST
+# a frame starts with the cookie, which can never be the first byte of an ascii request
+FRAME_FIRST_BYTE = Config.MAGIC_COOKIE >> 24
+
+FLAG_KEEPALIVE = 0x1
+
+PATTERN_A = 0
+PATTERN_ZERO = 1
+PATTERN_SEQUENCE = 2  # byte n of the logical file is n % 256, so ranges can be checked
+PATTERN_RANDOM = 3
+PATTERNS = {'A': PATTERN_A, 'zero': PATTERN_ZERO, 'sequence': PATTERN_SEQUENCE, 'random': PATTERN_RANDOM}
+
+
+class TcpRequest:
+    """
+    One TCP transfer request: length bytes of the logical file from offset.
+    It arrives either as the legacy ascii line "<length> [offset] [keepalive]"
+    or as a binary frame that starts with the magic cookie and also carries
+    the send chunk size, a pacing rate and the payload pattern. Zero chunk
+    size and rate leave the server's defaults.
+    """
+    __slots__ = ('length', 'offset', 'keep_alive', 'chunk_size', 'rate', 'pattern')
+
+    def __init__(self, length, offset=0, keep_alive=False, chunk_size=0, rate=0, pattern=PATTERN_A):
+        self.length = length
+        self.offset = offset
+        self.keep_alive = keep_alive
+        self.chunk_size = chunk_size
+        self.rate = rate
+        self.pattern = pattern
+
+    @staticmethod
+    def is_frame(first_byte):
+        return first_byte == FRAME_FIRST_BYTE
+
+    @classmethod
+    def from_ascii(cls, line):
+        fields = line.split()
+        keep_alive = bool(fields) and fields[-1] == 'keepalive'
+        if keep_alive:
+            fields.pop()
+        if not 1 <= len(fields) <= 2:
+            raise ValueError(f"malformed request {line!r}")
+        request = cls(int(fields[0]), int(fields[1]) if len(fields) == 2 else 0, keep_alive)
+        request.validate()
+        return request
+
+    @classmethod
+    def from_frame(cls, data):
+        if len(data) != TCP_REQUEST.size:
+            raise ValueError(f"truncated request frame ({len(data)} of {TCP_REQUEST.size} bytes)")
+        (magic_cookie, message_type, version, flags, pattern,
+         length, offset, chunk_size, rate) = TCP_REQUEST.unpack(data)
+        if magic_cookie != Config.MAGIC_COOKIE or message_type != Config.TCP_REQUEST_TYPE:
+            raise ValueError("not a tcp request frame")
+        if version != Config.TCP_REQUEST_VERSION:
+            raise ValueError(f"unsupported request version {version}")
+        request = cls(length, offset, bool(flags & FLAG_KEEPALIVE), chunk_size, rate, pattern)
+        request.validate()
+        return request
+
+    def validate(self):
+        if self.length <= 0 or self.offset < 0:
+            raise ValueError(f"invalid range: {self.length} bytes from {self.offset}")
+        if self.pattern not in PATTERNS.values():
+            raise ValueError(f"unknown payload pattern {self.pattern}")
+
+    def encode(self):
+        return TCP_REQUEST.pack(Config.MAGIC_COOKIE, Config.TCP_REQUEST_TYPE, Config.TCP_REQUEST_VERSION,
+                                FLAG_KEEPALIVE if self.keep_alive else 0, self.pattern,
+                                self.length, self.offset, self.chunk_size, self.rate)
+
+    #the legacy line; chunk size, rate and pattern cannot be expressed in it
+    def encode_ascii(self):
+        fields = [str(self.length)]
+        if self.offset:
+            fields.append(str(self.offset))
+        if self.keep_alive:
+            fields.append('keepalive')
+        return (' '.join(fields) + '\n').encode()
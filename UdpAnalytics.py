@@ -0,0 +1,105 @@
+from array import array
+
+GAP_LIMIT = 2 ** 32 - 1  # inter-arrival gaps are stored in microseconds
+
+
+#host-wide UDP datagrams dropped for a full receive buffer, None where /proc/net/snmp is missing
+def udp_receive_buffer_errors():
+    try:
+        with open('/proc/net/snmp') as snmp:
+            rows = [line.split() for line in snmp if line.startswith('Udp:')]
+    except OSError:
+        return None
+    if len(rows) < 2 or 'RcvbufErrors' not in rows[0]:
+        return None
+    return int(rows[1][rows[0].index('RcvbufErrors')])
+
+
+class UdpArrivalStats:
+    """
+    Arrival analytics for one UDP transfer, fed one timestamp per datagram.
+    Inter-arrival gaps, reordering depths and loss burst lengths go into
+    typed arrays, so a million datagrams cost a few megabytes and no
+    per-packet objects.
+
+    Payload headers carry no send time, so jitter is the RFC 3550 running
+    estimate J += (|D| - J) / 16 with D taken as the change between
+    consecutive inter-arrival gaps, which assumes evenly spaced sending.
+    """
+
+    def __init__(self):
+        self.gaps = array('I')
+        self.reorder_depths = array('I')
+        self.loss_bursts = array('I')
+        self.duplicates = 0
+        self.jitter_ns = 0.0
+        self.highest = 0
+        self.last_arrival_ns = None
+        self.last_gap_ns = None
+        self.bursts_recorded = False
+        self.rcvbuf_errors_at_start = udp_receive_buffer_errors()
+        self.rcvbuf_errors = None
+
+    #one datagram: new is False for duplicates; first_pass is False once retransmissions were requested,
+    #after that resent segments arrive late by design and only duplicates are counted
+    def on_arrival(self, packet_number, arrival_ns, new, first_pass=True):
+        # timing stops at the first NACK: the quiet wait before it is not an arrival gap
+        if not first_pass:
+            if not new:
+                self.duplicates += 1
+            return
+        if self.last_arrival_ns is not None:
+            gap = arrival_ns - self.last_arrival_ns
+            self.gaps.append(min(gap // 1000, GAP_LIMIT))
+            if self.last_gap_ns is not None:
+                self.jitter_ns += (abs(gap - self.last_gap_ns) - self.jitter_ns) / 16
+            self.last_gap_ns = gap
+        self.last_arrival_ns = arrival_ns
+
+        if not new:
+            self.duplicates += 1
+        elif packet_number > self.highest:
+            self.highest = packet_number
+        else:
+            self.reorder_depths.append(self.highest - packet_number)
+
+    #lengths of the runs of missing packets, as (first, count) ranges from PacketBitmap.missing_ranges
+    def record_loss_bursts(self, missing_ranges):
+        if self.bursts_recorded:
+            return
+        self.bursts_recorded = True
+        self.loss_bursts.extend(count for _, count in missing_ranges)
+        if self.rcvbuf_errors_at_start is not None:
+            self.rcvbuf_errors = udp_receive_buffer_errors() - self.rcvbuf_errors_at_start
+
+    #what the drop counters suggest about lost packets, None when nothing was lost
+    def loss_cause(self, lost):
+        if not lost:
+            return None
+        if self.rcvbuf_errors is None:
+            return "unknown (no receive buffer counters)"
+        if self.rcvbuf_errors >= lost / 2:
+            return "receiver overrun (receive buffer full)"
+        return "sender bursts or the network"
+
+    #burst length -> number of bursts, lengths grouped in powers of two
+    def burst_distribution(self):
+        distribution = {}
+        for length in self.loss_bursts:
+            bucket = 1 << (length.bit_length() - 1)
+            distribution[bucket] = distribution.get(bucket, 0) + 1
+        return dict(sorted(distribution.items()))
+
+    def summary(self):
+        gaps = sorted(self.gaps)
+        return {
+            'jitter': self.jitter_ns / 1e9,
+            'gap_p50': gaps[len(gaps) // 2] / 1e6 if gaps else 0.0,
+            'gap_max': gaps[-1] / 1e6 if gaps else 0.0,
+            'reordered': len(self.reorder_depths),
+            'reorder_depth_max': max(self.reorder_depths, default=0),
+            'duplicates': self.duplicates,
+            'loss_bursts': len(self.loss_bursts),
+            'loss_burst_max': max(self.loss_bursts, default=0),
+            'rcvbuf_errors': self.rcvbuf_errors,
+        }
@@ -0,0 +1,140 @@
+import ctypes
+import errno
+import os
+import select
+import socket
+import struct
+import sys
+from Config import Config
+from Protocol import PAYLOAD_HEADER, pack_payload_header_into
+
+
+class IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+def load_sendmmsg():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+class UdpBatchEmitter:
+    """
+    Packs payload segments into a reusable ring of datagram slots and sends a
+    whole batch per syscall: sendmmsg() on Linux, one sendto() per slot elsewhere.
+    The payload bytes of every slot are written once; only headers are packed per segment.
+    """
+    sendmmsg = load_sendmmsg()
+
+    def __init__(self, udp_socket, batch_size=Config.UDP_BATCH_SIZE):
+        self.udp_socket = udp_socket
+        self.batch_size = batch_size
+        self.slot_size = PAYLOAD_HEADER.size + Config.CHUNK_SIZE
+        self.ring = bytearray(b'A' * (self.slot_size * batch_size))
+        self.view = memoryview(self.ring)
+        self.lengths = [0] * batch_size
+        self.pending = 0
+        self.syscalls = 0
+
+        if self.sendmmsg is not None and udp_socket.family == socket.AF_INET:
+            self.setup_mmsg()
+        else:
+            self.flush = self.flush_sendto
+
+    def setup_mmsg(self):
+        self.ring_address = ctypes.addressof((ctypes.c_char * len(self.ring)).from_buffer(self.ring))
+        self.iovecs = (IoVec * self.batch_size)()
+        self.messages = (MMsgHdr * self.batch_size)()
+        self.sockaddr = ctypes.create_string_buffer(16)
+        self.sockaddr_for = None
+        for slot in range(self.batch_size):
+            self.iovecs[slot].iov_base = self.ring_address + slot * self.slot_size
+            header = self.messages[slot].msg_hdr
+            header.msg_name = ctypes.addressof(self.sockaddr)
+            header.msg_namelen = 16
+            header.msg_iov = ctypes.pointer(self.iovecs[slot])
+            header.msg_iovlen = 1
+        self.flush = self.flush_sendmmsg
+
+    #sends segment_numbers (zero based) of session, returns bytes put on the wire
+    def emit(self, session, segment_numbers):
+        bytes_sent = 0
+        for segment_number in segment_numbers:
+            slot = self.pending
+            pack_payload_header_into(self.ring, slot * self.slot_size, session.total_segments, segment_number + 1)
+            self.lengths[slot] = PAYLOAD_HEADER.size + session.payload_size(segment_number)
+            self.pending += 1
+            if self.pending == self.batch_size:
+                bytes_sent += self.flush(session.address)
+        if self.pending:
+            bytes_sent += self.flush(session.address)
+        return bytes_sent
+
+    def flush_sendto(self, address):
+        bytes_sent = 0
+        for slot in range(self.pending):
+            offset = slot * self.slot_size
+            bytes_sent += self.udp_socket.sendto(self.view[offset:offset + self.lengths[slot]], address)
+            self.syscalls += 1
+        self.pending = 0
+        return bytes_sent
+
+    def flush_sendmmsg(self, address):
+        if address != self.sockaddr_for:
+            # struct sockaddr_in: family in host order, port and address in network order
+            self.sockaddr.raw = (struct.pack('=H', socket.AF_INET) + struct.pack('!H', address[1])
+                                 + socket.inet_aton(address[0]) + bytes(8))
+            self.sockaddr_for = address
+
+        bytes_sent = 0
+        for slot in range(self.pending):
+            self.iovecs[slot].iov_len = self.lengths[slot]
+            bytes_sent += self.lengths[slot]
+
+        fd = self.udp_socket.fileno()
+        done = 0
+        while done < self.pending:
+            count = self.sendmmsg(fd, ctypes.addressof(self.messages[done]), self.pending - done, 0)
+            self.syscalls += 1
+            if count >= 0:
+                done += count
+                continue
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                # the socket has a timeout, so its fd is non-blocking: wait for room like sendto() would
+                _, writable, _ = select.select([], [fd], [], Config.TIMEOUT)
+                if not writable:
+                    self.pending = 0
+                    raise socket.timeout("timed out waiting to send UDP batch")
+                continue
+            self.pending = 0
+            raise OSError(err, os.strerror(err))
+
+        self.pending = 0
+        return bytes_sent
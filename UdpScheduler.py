@@ -0,0 +1,252 @@
+import math
+import threading
+import time
+from collections import deque
+from Config import Config
+from UdpEmitter import UdpBatchEmitter
+from Protocol import PAYLOAD_HEADER
+from Pacing import AimdController, TokenBucket
+
+
+class UdpSession:
+    """
+    One client's UDP transfer: which segment goes out next, which segments the
+    client asked to have resent, and how much was sent.
+    """
+
+    def __init__(self, address, file_size):
+        self.address = address
+        self.file_size = file_size
+        self.total_segments = math.ceil(file_size / Config.CHUNK_SIZE)
+        self.next_segment = 0
+        self.bytes_sent = 0
+        self.start_time = time.time()
+        self.last_sent = self.start_time
+        # monotonic timing for the server's histograms
+        self.created_ns = time.monotonic_ns()
+        self.last_sent_ns = None
+
+        # reliable mode: zero based [first, count] ranges from the latest NACK
+        self.retransmit = deque()
+        self.retransmitted_segments = 0
+        self.feedback_rounds = 0
+        self.acknowledged = False
+        self.linger_until = 0
+
+        if Config.UDP_AIMD:
+            self.pacer = TokenBucket(Config.UDP_SESSION_RATE or Config.UDP_AIMD_START_RATE)
+            self.rate_control = AimdController(self.pacer)
+        else:
+            self.pacer = TokenBucket(Config.UDP_SESSION_RATE)
+            self.rate_control = None
+
+        # segments are generated per turn, so a session never holds more than one burst
+        slot_size = PAYLOAD_HEADER.size + Config.CHUNK_SIZE
+        self.burst_segments = max(1, min(Config.UDP_BURST_SEGMENTS, Config.UDP_SESSION_MEMORY // slot_size))
+        self.memory = self.burst_segments * slot_size
+
+    def has_pending(self):
+        return bool(self.retransmit) or self.next_segment < self.total_segments
+
+    #segments for the next turn: requested retransmissions first, then new ones
+    def next_burst(self):
+        burst = []
+        while self.retransmit and len(burst) < self.burst_segments:
+            missing = self.retransmit[0]
+            count = min(missing[1], self.burst_segments - len(burst))
+            burst.extend(range(missing[0], missing[0] + count))
+            missing[0] += count
+            missing[1] -= count
+            if not missing[1]:
+                self.retransmit.popleft()
+        self.retransmitted_segments += len(burst)
+
+        if len(burst) < self.burst_segments and self.next_segment < self.total_segments:
+            last_segment = min(self.next_segment + self.burst_segments - len(burst), self.total_segments)
+            burst.extend(range(self.next_segment, last_segment))
+            self.next_segment = last_segment
+        return burst
+
+    #the latest NACK replaces older ones; segments not sent yet will go out anyway.
+    #a NACK without ranges is a progress report and leaves queued retransmissions alone
+    def apply_feedback(self, highest, received, ranges):
+        self.feedback_rounds += 1
+        self.acknowledged = received >= self.total_segments
+        if self.rate_control:
+            self.rate_control.on_feedback(highest, received)
+        if not ranges:
+            return
+        self.retransmit.clear()
+        for first, count in ranges:
+            first -= 1
+            last = min(first + count, self.next_segment)
+            if 0 <= first < last:
+                self.retransmit.append([first, last - first])
+
+    #times a burst of size bytes on metrics, the first one also as the time to first byte
+    def record_send(self, metrics, size, started_ns, finished_ns):
+        if self.last_sent_ns is None:
+            metrics.first_byte.record(finished_ns - self.created_ns)
+        metrics.record_send(size, started_ns, finished_ns)
+        self.bytes_sent += size
+        self.last_sent_ns = finished_ns
+
+    def payload_size(self, segment_number):
+        return min(Config.CHUNK_SIZE, self.file_size - segment_number * Config.CHUNK_SIZE)
+
+
+class UdpSessionScheduler:
+    """
+    Sends every live UDP session from one thread, round-robin, one burst per
+    session per turn, so a large transfer never blocks the request receiver.
+    Sessions are admitted only while their burst fits in the server memory
+    budget; the rest wait in arrival order. A session that has sent everything
+    lingers for UDP_NACK_LINGER seconds so a reliable client can ask for
+    missing segments, and is completed early once the client acknowledges.
+    Each burst must clear both the session's and the server's TokenBucket.
+    """
+
+    def __init__(self, udp_socket, budget, pacer, on_complete, on_error, metrics):
+        self.emitter = UdpBatchEmitter(udp_socket)
+        self.budget = budget
+        self.pacer = pacer
+        if not budget.try_reserve(len(self.emitter.ring)):
+            raise ValueError("UDP_SERVER_MEMORY is smaller than the UDP send ring")
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.metrics = metrics
+        self.sessions = deque()
+        self.waiting = deque()
+        self.lingering = {}
+        self.by_address = {}
+        self.has_work = threading.Condition()
+        self.is_running = True
+
+    @property
+    def live_sessions(self):
+        return len(self.sessions) + len(self.lingering)
+
+    @property
+    def waiting_sessions(self):
+        return len(self.waiting)
+
+    def add(self, session):
+        with self.has_work:
+            # a new request from the same socket ends the one lingering there
+            replaced = self.lingering.pop(session.address, None)
+            self.by_address[session.address] = session
+            self.waiting.append(session)
+            self.admit()
+            self.has_work.notify()
+        if replaced:
+            self.on_complete(replaced)
+
+    #routes a NACK to its session, returns False when no session matches
+    def feedback(self, address, highest, received, ranges):
+        finished = None
+        with self.has_work:
+            session = self.by_address.get(address)
+            if session is None:
+                return False
+            session.apply_feedback(highest, received, ranges)
+            if address in self.lingering:
+                if session.acknowledged:
+                    finished = self.lingering.pop(address)
+                    self.forget(finished)
+                elif session.has_pending():
+                    self.waiting.append(self.lingering.pop(address))
+                    self.admit()
+                    self.has_work.notify()
+        if finished:
+            self.on_complete(finished)
+        return True
+
+    #caller holds has_work
+    def admit(self):
+        while self.waiting and self.budget.try_reserve(self.waiting[0].memory):
+            self.sessions.append(self.waiting.popleft())
+
+    #caller holds has_work
+    def forget(self, session):
+        if self.by_address.get(session.address) is session:
+            del self.by_address[session.address]
+
+    #caller holds has_work
+    def collect_expired(self):
+        now = time.time()
+        expired = [session for session in self.lingering.values() if session.linger_until <= now]
+        for session in expired:
+            del self.lingering[session.address]
+            self.forget(session)
+        return expired
+
+    #caller holds has_work; returns a session whose pacers allow a burst, or waits and returns None
+    def next_ready_session(self):
+        wait = self.pacer.wait_time()
+        if wait > 0:
+            self.has_work.wait(wait)
+            return None
+        for _ in range(len(self.sessions)):
+            session = self.sessions.popleft()
+            session_wait = session.pacer.wait_time()
+            if session_wait <= 0:
+                return session
+            self.sessions.append(session)
+            wait = session_wait if wait <= 0 else min(wait, session_wait)
+        self.has_work.wait(wait)
+        return None
+
+    def stop(self):
+        with self.has_work:
+            self.is_running = False
+            self.has_work.notify_all()
+
+    def run(self):
+        while self.is_running:
+            with self.has_work:
+                expired = self.collect_expired()
+                while not self.sessions and not expired and self.is_running:
+                    self.has_work.wait(Config.UDP_NACK_LINGER / 2 if self.lingering else None)
+                    expired = self.collect_expired()
+                if not self.is_running:
+                    break
+                session = self.next_ready_session() if self.sessions else None
+                burst = session.next_burst() if session else None
+
+            for finished in expired:
+                self.on_complete(finished)
+            if session is None:
+                continue
+
+            try:
+                send_started = time.monotonic_ns()
+                bytes_sent = self.emitter.emit(session, burst)
+                session.record_send(self.metrics, bytes_sent, send_started, time.monotonic_ns())
+                session.last_sent = time.time()
+                session.pacer.consume(bytes_sent)
+                self.pacer.consume(bytes_sent)
+            except Exception as e:
+                with self.has_work:
+                    self.forget(session)
+                    self.budget.release(session.memory)
+                    self.admit()
+                self.on_error(session, e)
+                continue
+
+            with self.has_work:
+                if session.has_pending():
+                    self.sessions.append(session)
+                    continue
+                self.budget.release(session.memory)
+                self.admit()
+                if session.acknowledged or self.by_address.get(session.address) is not session:
+                    # NACKs from this socket now go to its newer request, so this one cannot linger
+                    self.forget(session)
+                    finished = session
+                else:
+                    session.linger_until = time.time() + Config.UDP_NACK_LINGER
+                    # like add(), a session lingering for the same socket ends here
+                    finished = self.lingering.pop(session.address, None)
+                    self.lingering[session.address] = session
+            if finished:
+                self.on_complete(finished)
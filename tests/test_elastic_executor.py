@@ -0,0 +1,28 @@
+import threading
+import time
+from Config import Config
+from ServerNew import Server
+
+
+def test_queued_connection_is_served_while_every_worker_is_busy(monkeypatch):
+    monkeypatch.setattr(Config, 'POOL_MIN_WORKERS', 2)
+    monkeypatch.setattr(Config, 'POOL_MAX_WORKERS', 4)
+    server = Server()
+    release = threading.Event()
+    served = threading.Event()
+    try:
+        threading.Thread(target=server.monitor_load, daemon=True).start()
+        # long transfers holding every worker
+        for _ in range(Config.POOL_MIN_WORKERS):
+            server.thread_pool.submit(release.wait)
+        start = time.monotonic()
+        server.thread_pool.submit(served.set)
+        assert served.wait(2), server.pool_statistics()
+        assert time.monotonic() - start < 1
+        assert server.thread_pool.workers > Config.POOL_MIN_WORKERS
+    finally:
+        release.set()
+        server.stop()
+        server.thread_pool.shutdown()
+        server.tcp_socket.close()
+        server.udp_socket.close()
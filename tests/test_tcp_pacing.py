@@ -0,0 +1,47 @@
+import asyncio
+import socket
+import threading
+import time
+import pytest
+from Config import Config
+from ServerNew import Server
+from AsyncServer import AsyncServer
+
+
+def serve_one_thread(server):
+    connection, address = server.tcp_socket.accept()
+    server.handle_tcp_client(connection, address)
+
+
+def serve_asyncio(server):
+    asyncio.run(server.serve())
+
+
+#seconds from sending the request to the last byte of the response
+def timed_download(port, size):
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as client:
+        start = time.monotonic()
+        client.sendall(f"{size}\n".encode())
+        received = 0
+        while received < size:
+            data = client.recv(Config.CLIENT_TCP_RECV_SIZE)
+            assert data, f"connection closed after {received} of {size} bytes"
+            received += len(data)
+        return time.monotonic() - start
+
+
+@pytest.mark.parametrize('engine, serve', [(Server, serve_one_thread), (AsyncServer, serve_asyncio)])
+def test_paced_transfer_smaller_than_one_send_chunk_keeps_the_rate(monkeypatch, engine, serve):
+    rate = 1000 * 1000
+    size = 200 * 1000
+    assert size < Config.TCP_SEND_SIZE
+    monkeypatch.setattr(Config, 'TCP_RATE_LIMIT', rate)
+    server = engine()
+    try:
+        threading.Thread(target=serve, args=(server,), daemon=True).start()
+        elapsed = timed_download(server.SERVER_TCP_PORT, size)
+    finally:
+        server.stop()
+        if server.thread_pool:
+            server.thread_pool.shutdown()
+    assert size / rate * 0.95 <= elapsed < size / rate * 2
@@ -0,0 +1,44 @@
+import math
+import socket
+import threading
+import time
+from Config import Config
+from Protocol import PAYLOAD_HEADER, pack_request
+from ServerNew import Server
+
+
+def wire_size(file_size):
+    return file_size + math.ceil(file_size / Config.CHUNK_SIZE) * PAYLOAD_HEADER.size
+
+
+def test_two_requests_from_one_socket_both_complete(monkeypatch):
+    monkeypatch.setattr(Config, 'UDP_NACK_LINGER', 0.1)
+    server = Server()
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        threading.Thread(target=server.handle_udp_requests, daemon=True).start()
+        threading.Thread(target=server.udp_scheduler.run, daemon=True).start()
+        # the second, smaller request finishes first and lingers while the first is still sending
+        sizes = [2 * 1024 * 1024, 64 * 1024]
+        for size in sizes:
+            client.sendto(pack_request(size), ('127.0.0.1', server.SERVER_UDP_PORT))
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            stats = server.statistics()
+            if stats['udp_bytes'] == sum(map(wire_size, sizes)) and not stats['active_clients']:
+                break
+            time.sleep(0.05)
+        stats = server.statistics()
+        assert stats['udp_connections'] == 2
+        assert stats['live_udp_sessions'] == 0
+        assert stats['active_clients'] == 0
+        assert stats['active_udp'] == 0
+        assert stats['udp_bytes'] == sum(map(wire_size, sizes))
+    finally:
+        client.close()
+        server.stop()
+        server.udp_scheduler.stop()
+        server.thread_pool.shutdown()
+        server.tcp_socket.close()
+        server.udp_socket.close()